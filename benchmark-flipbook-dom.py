@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Measure how the flipbook's DOM grows with the number of stories.
+
+Builds single-file and paginated flipbooks from the first N stories of the
+part files and counts elements: those in the generated page itself, and
+the pages the reader script fills in from the built output. 'all pages' is
+every story page of the single-file flipbook at once, as the old reader
+built them up front; 'window' is the most elements in any
+PAGES_BEHIND + 1 + PAGES_AHEAD run of the paginated flipbook's chunk pages,
+which is what the current reader keeps alive.
+
+    python3 benchmark-flipbook-dom.py
+    python3 benchmark-flipbook-dom.py --counts 10 100 1000
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import tempfile
+from html.parser import HTMLParser
+from itertools import cycle, islice
+
+from stories import source_files
+from story_tokenizer import StoryTokenizer
+
+spec = importlib.util.spec_from_file_location(
+    'generate_flipbook', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generate-flipbook.py'))
+flipbook = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(flipbook)
+
+
+# Elements without an end tag
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track',
+                 'wbr'}
+
+
+class ElementCounter(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.count += 1
+
+
+def count_elements(html):
+    counter = ElementCounter()
+    counter.feed(html)
+    counter.close()
+    return counter.count
+
+
+class StoryCounter(HTMLParser):
+    """Count the elements inside each <div class="story">: what the reader copies into a page."""
+
+    def __init__(self):
+        super().__init__()
+        self.counts = []
+        self.depth = 0  # open elements inside the current story, 0 outside one
+
+    def handle_starttag(self, tag, attrs):
+        if self.depth:
+            self.counts[-1] += 1
+            if tag not in VOID_ELEMENTS:
+                self.depth += 1
+        elif tag == 'div' and 'story' in (dict(attrs).get('class') or '').split():
+            self.counts.append(0)
+            self.depth = 1
+
+    def handle_startendtag(self, tag, attrs):
+        if self.depth:
+            self.counts[-1] += 1
+
+    def handle_endtag(self, tag):
+        if self.depth and tag not in VOID_ELEMENTS:
+            self.depth -= 1
+
+
+def story_page_sizes(path):
+    """Element count of each story page the single-file reader builds from the flipbook at path."""
+    counter = StoryCounter()
+    with open(path, 'r', encoding='utf-8') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), ''):
+            counter.feed(chunk)
+    counter.close()
+    return counter.counts
+
+
+def chunk_page_sizes(chunk_dir):
+    """Element count of each page in a paginated flipbook's chunks, in order."""
+    sizes = []
+    for name in sorted(os.listdir(chunk_dir)):
+        if name.startswith('pages-') and name.endswith('.json'):
+            with open(os.path.join(chunk_dir, name), 'r', encoding='utf-8') as f:
+                sizes.extend(count_elements(page) for page in json.load(f))
+    return sizes
+
+
+def load_corpus(parts, limit):
+    """Return (header, [(story, illustration), ...]) for up to limit stories."""
+    header = None
+    blocks = []
+    for filename in parts:
+        with open(filename, 'r', encoding='utf-8') as f:
+            tokens = StoryTokenizer(f)
+            if header is None:
+                header = tokens.header
+            blocks.extend(islice(tokens, limit - len(blocks)))
+        if len(blocks) >= limit:
+            break
+    return header, blocks
+
+
+def reader_elements(page_sizes, window):
+    """Most reader-built elements alive at once, for every page or a window of them.
+
+    page_sizes holds the element count of each page including the cover;
+    every page but the cover also gets a page-number div.
+    """
+    per_page = page_sizes[:1] + [size + 1 for size in page_sizes[1:]]
+    if window is None:
+        return sum(per_page)
+    behind, ahead = window
+    peak = 0
+    for current in range(len(per_page) + 1):
+        first = max(0, current - behind)
+        peak = max(peak, sum(per_page[first:current + ahead + 1]))
+    return peak
+
+
+def measure(header, blocks, count, work_dir):
+    stories = list(islice(cycle(blocks), count))
+    source = os.path.join(work_dir, f'stories-{count}.html')
+    with open(source, 'w', encoding='utf-8') as f:
+        f.write(header)
+        for story, illustration in stories:
+            f.write(story + '\n' + illustration + '\n')
+        f.write('</div>\n</body>\n</html>')
+
+    single = os.path.join(work_dir, f'stories-{count}-flipbook.html')
+    paginated = os.path.join(work_dir, f'stories-{count}-paginated.html')
+    with contextlib.redirect_stdout(io.StringIO()):
+        flipbook.build_single(source, single)
+        flipbook.build_paginated(source, paginated, 50)
+
+    with open(single, 'r', encoding='utf-8') as f:
+        single_elements = count_elements(f.read())
+    with open(paginated, 'r', encoding='utf-8') as f:
+        shell_elements = count_elements(f.read())
+
+    # The cover is an h1, h2 and p; the other pages come from the built output
+    cover = [3]
+    window = (flipbook.PAGES_BEHIND, flipbook.PAGES_AHEAD)
+    return {
+        'stories': count,
+        'single MB': os.path.getsize(single) / (1024 * 1024),
+        'page elements': single_elements,
+        'all pages': reader_elements(cover + story_page_sizes(single), None),
+        'window': reader_elements(cover + chunk_page_sizes(os.path.splitext(paginated)[0]), window),
+        'paginated shell': shell_elements,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure flipbook DOM size against story count')
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 100, 1000],
+                        help='story counts to build (default: %(default)s)')
+    args = parser.parse_args()
+
+    parts = source_files()
+    if not parts:
+        raise SystemExit("No illustrated-stories-part-*.html files found")
+    header, blocks = load_corpus([os.path.abspath(part) for part in parts], max(args.counts))
+    if not blocks:
+        raise SystemExit("No stories found in the part files")
+
+    columns = ('stories', 'single MB', 'page elements', 'all pages', 'window', 'paginated shell')
+    print(''.join(f"{name:>17}" for name in columns))
+    with tempfile.TemporaryDirectory() as work_dir:
+        for count in sorted(args.counts):
+            row = measure(header, blocks, count, work_dir)
+            print(''.join(f"{row[name]:>17.1f}" if isinstance(row[name], float) else f"{row[name]:>17}"
+                          for name in columns))
+    print("'all pages' counts every story page of the built single-file flipbook at once, as a reader that "
+          "builds them up front holds; 'window' is the current reader's peak over the built chunk pages")
+
+
+if __name__ == '__main__':
+    main()
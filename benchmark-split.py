@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Time the story tokenizer against the old lazy-dot regexes on the part files"""
+
+import glob
+import re
+import time
+
+from story_tokenizer import StoryTokenizer
+
+# The patterns split-stories-correct.py and split-stories.py used to run
+LEGACY_PATTERNS = {
+    'split-stories-correct.py regex': r'<div class="story">.*?</div>\s*</div>\s*<div class="story-illustration".*?</div>',
+    'split-stories.py regex': r'<div>\s*<img[^>]*>.*?<div class="story">.*?</div>\s*</div>',
+}
+
+
+def part_number(filename):
+    return int(re.search(r'(\d+)\.html$', filename).group(1))
+
+
+def part_files():
+    # Skip the *-flipbook.html files generate-flipbook.py writes next to the parts
+    return sorted((filename for filename in glob.glob('illustrated-stories-part-*.html')
+                   if re.fullmatch(r'illustrated-stories-part-\d+\.html', filename)), key=part_number)
+
+
+def time_regex(filename, pattern):
+    start = time.perf_counter()
+    with open(filename, 'r', encoding='utf-8') as f:
+        blocks = re.findall(pattern, f.read(), re.DOTALL)
+    return time.perf_counter() - start, len(blocks)
+
+
+def time_tokenizer(filename):
+    start = time.perf_counter()
+    with open(filename, 'r', encoding='utf-8') as f:
+        count = sum(1 for _ in StoryTokenizer(f))
+    return time.perf_counter() - start, count
+
+
+parts = part_files()
+if not parts:
+    raise SystemExit("No illustrated-stories-part-*.html files found")
+
+methods = {'story_tokenizer': time_tokenizer}
+for name, pattern in LEGACY_PATTERNS.items():
+    methods[name] = lambda filename, pattern=pattern: time_regex(filename, pattern)
+
+print(f"{'file':<36}" + ''.join(f"{name:>34}" for name in methods))
+totals = {name: [0.0, 0] for name in methods}
+for filename in parts:
+    row = f"{filename:<36}"
+    for name, method in methods.items():
+        seconds, count = method(filename)
+        totals[name][0] += seconds
+        totals[name][1] += count
+        row += f"{f'{seconds * 1000:.0f}ms ({count} blocks)':>34}"
+    print(row)
+
+print(f"{'total':<36}" + ''.join(
+    f"{f'{seconds:.2f}s ({count} blocks)':>34}" for seconds, count in totals.values()))
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""Build the static full-text search index and search.html.
+
+Indexes the title and text of every story in the part files (see
+stories/search.py) and writes:
+
+    search/meta.json        story titles, parts, themes and lengths, and
+                            where each story's bytes are in its part
+    search/terms-<xx>.json  postings of the terms starting with xx
+    search.html             a search box that fetches meta.json plus the
+                            shards of the words typed, ranks with BM25, and
+                            opens a story with a Range request
+
+The byte locations come from stories-manifest.json and are only kept for
+parts the manifest still describes, so run this again after re-splitting.
+search.html checks each part's size against the one indexed and links to
+the part instead of showing the wrong story when they differ.
+
+Shards whose contents didn't change are left alone, so browsers and the
+precompressed sidecars keep their cached copies.
+
+    python3 build-search-index.py
+    python3 build-search-index.py --query 'golden egg'   # also rank from Python
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from collections import Counter, defaultdict
+
+from stories import DEFAULT_SOURCES, Corpus
+from stories.search import B, INDEX_VERSION, K1, OTHER_SHARD, SHARD_PREFIX, STOP_WORDS, build_index, search
+from story_images import write_file
+
+SEARCH_DIR = 'search'
+META_FILE = 'meta.json'
+SEARCH_PAGE = 'search.html'
+# Written by split-stories-correct.py
+MANIFEST_FILE = 'stories-manifest.json'
+SHARD_NAME = re.compile(r'terms-(\w+)\.json')
+
+SEARCH_HTML = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Search the Tales from Chickenopolis</title>
+    <style>
+        body {
+            margin: 0;
+            font-family: 'Georgia', serif;
+            background: #fffef9;
+            color: #333;
+        }
+        main {
+            max-width: 800px;
+            margin: 0 auto;
+            padding: 30px 20px;
+        }
+        #query {
+            width: 100%%;
+            box-sizing: border-box;
+            padding: 12px 18px;
+            font-size: 1.1em;
+            border: 2px solid #e6d1a3;
+            border-radius: 20px;
+        }
+        #query:focus { outline: none; border-color: #d97428; }
+        #status { color: #888; margin: 10px 4px; }
+        #results { list-style: none; padding: 0; }
+        #results li { margin: 6px 0; }
+        #results button {
+            width: 100%%;
+            text-align: left;
+            padding: 10px 14px;
+            border: none;
+            border-radius: 10px;
+            background: #fff5e1;
+            font-family: inherit;
+            font-size: 1em;
+            cursor: pointer;
+        }
+        #results button:hover { background: #ffe4b3; }
+        .result-meta { color: #888; font-size: 0.85em; }
+        #story img { max-width: 100%%; height: auto; }
+    </style>
+</head>
+<body>
+    <main>
+        <h1>Search the stories</h1>
+        <input id="query" type="search" placeholder="e.g. golden egg, dragon, treasure" autofocus>
+        <div id="status"></div>
+        <ol id="results"></ol>
+        <div id="story"></div>
+    </main>
+
+    <script>
+        const SEARCH_DIR = '%(search_dir)s/';
+        const MAX_RESULTS = 20;
+        const shards = new Map();
+        let meta = null;
+        let searchId = 0;
+
+        async function loadMeta() {
+            if (!meta) {
+                meta = await (await fetch(SEARCH_DIR + '%(meta_file)s')).json();
+                meta.stopWords = new Set(meta.stopWords);
+                meta.averageLength = meta.stories.reduce((sum, story) => sum + story[3], 0) / meta.stories.length;
+            }
+            return meta;
+        }
+
+        // Same terms as stories/search.py's tokenize()
+        function tokenize(text) {
+            return (text.toLowerCase().match(/[\\p{L}\\p{N}]+/gu) || [])
+                .filter(term => term.length > 1 && !meta.stopWords.has(term));
+        }
+
+        function shardKey(term) {
+            const prefix = term.slice(0, meta.shardPrefix);
+            return /^[a-z0-9]+$/.test(prefix) ? prefix : meta.otherShard;
+        }
+
+        function loadShard(key) {
+            if (!shards.has(key)) {
+                // Missing shards (no indexed term starts that way) count as empty
+                shards.set(key, meta.shards.includes(key)
+                    ? fetch(`${SEARCH_DIR}terms-${key}.json`).then(response => response.json())
+                    : Promise.resolve({}));
+            }
+            return shards.get(key);
+        }
+
+        // BM25 over the delta-encoded [gap, frequency, ...] postings
+        async function rank(query) {
+            await loadMeta();
+            const terms = [...new Set(tokenize(query))];
+            const loaded = await Promise.all(terms.map(term => loadShard(shardKey(term))));
+            const count = meta.stories.length;
+            const scores = new Map();
+            terms.forEach((term, i) => {
+                const postings = loaded[i][term];
+                if (!postings) return;
+                const matches = postings.length / 2;
+                const idf = Math.log(1 + (count - matches + 0.5) / (matches + 0.5));
+                let number = 0;
+                for (let p = 0; p < postings.length; p += 2) {
+                    number += postings[p];
+                    const frequency = postings[p + 1];
+                    const length = meta.stories[number - 1][3];
+                    const score = idf * frequency * (meta.k1 + 1)
+                        / (frequency + meta.k1 * (1 - meta.b + meta.b * length / meta.averageLength));
+                    scores.set(number, (scores.get(number) || 0) + score);
+                }
+            });
+            return [...scores].sort((a, b) => b[1] - a[1] || a[0] - b[0]).slice(0, MAX_RESULTS);
+        }
+
+        // The part size recorded in the index, or NaN if the response doesn't say
+        function partSize(response, bytes) {
+            if (response.status !== 206) return bytes.byteLength;
+            return Number((response.headers.get('Content-Range') || '').split('/')[1]);
+        }
+
+        async function showStory(number) {
+            const storyDiv = document.getElementById('story');
+            const [title, part, , , offset, length] = meta.stories[number - 1];
+            storyDiv.textContent = `Loading ${title}...`;
+            try {
+                // null when the index was built without a manifest for this part
+                if (offset === null) throw new Error(`${part} is not in the index`);
+                // Only this story's bytes, if the server honours Range
+                const response = await fetch(part, {
+                    headers: {Range: `bytes=${offset}-${offset + length - 1}`}
+                });
+                if (!response.ok) throw new Error(`${part}: ${response.status}`);
+                let bytes = await response.arrayBuffer();
+                const size = partSize(response, bytes);
+                if (response.status !== 206) bytes = bytes.slice(offset, offset + length);
+                const html = new TextDecoder().decode(bytes);
+                if ((!Number.isNaN(size) && size !== meta.parts[part]) || !html.startsWith('<div class="story"')) {
+                    document.getElementById('status').textContent =
+                        'The stories changed since the search index was built; run build-search-index.py again';
+                    throw new Error(`${part} does not match the index`);
+                }
+                storyDiv.innerHTML = html;
+            } catch (error) {
+                storyDiv.innerHTML = '';
+                const link = document.createElement('a');
+                link.href = part;
+                link.textContent = `Read ${title} in ${part}`;
+                storyDiv.appendChild(link);
+            }
+            storyDiv.scrollIntoView({behavior: 'smooth'});
+        }
+
+        async function runSearch(query) {
+            const id = ++searchId;
+            const status = document.getElementById('status');
+            const list = document.getElementById('results');
+            if (!query.trim()) {
+                status.textContent = '';
+                list.innerHTML = '';
+                return;
+            }
+            status.textContent = 'Searching...';
+            const results = await rank(query);
+            if (id !== searchId) return;  // a newer search has started
+            list.innerHTML = '';
+            status.textContent = results.length ? '' : 'No stories found';
+            for (const [number] of results) {
+                const [title, part, theme] = meta.stories[number - 1];
+                const item = document.createElement('li');
+                const button = document.createElement('button');
+                button.textContent = title;
+                const info = document.createElement('div');
+                info.className = 'result-meta';
+                info.textContent = [`Story ${number}`, theme, part].filter(Boolean).join(' \\u00b7 ');
+                button.appendChild(info);
+                button.addEventListener('click', () => showStory(number));
+                item.appendChild(button);
+                list.appendChild(item);
+            }
+        }
+
+        let timer = null;
+        document.getElementById('query').addEventListener('input', event => {
+            clearTimeout(timer);
+            timer = setTimeout(() => runSearch(event.target.value), 200);
+        });
+    </script>
+</body>
+</html>
+'''
+
+
+def write_if_changed(path, text):
+    """Write text to path unless it already holds exactly that; return True if written."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == text:
+                return False
+    except OSError:
+        pass
+    write_file(path, text)
+    return True
+
+
+def story_locations(docs, manifest_path=MANIFEST_FILE):
+    """Return ({part: bytes}, [[offset, length] or None, ...]) for docs from the split manifest.
+
+    A story is located only if the manifest lists its part at the size the
+    file has now, and the same title at the same place in that part;
+    search.html links the other stories to their part instead.
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    sizes = {}
+    for part in manifest.get('parts', []):
+        try:
+            if os.path.getsize(part['file']) == part['bytes']:
+                sizes[os.path.normpath(part['file'])] = part['bytes']
+        except OSError:
+            pass
+    entries = defaultdict(list)
+    for entry in manifest.get('stories', []):
+        entries[os.path.normpath(entry['part'])].append(entry)
+
+    part_sizes = {}
+    locations = []
+    position = Counter()
+    for title, part, *_ in docs:
+        key = os.path.normpath(part)
+        index = position[key]
+        position[key] += 1
+        entry = entries[key][index] if index < len(entries[key]) else None
+        if key in sizes and entry is not None and entry['title'] == title:
+            part_sizes[part] = sizes[key]
+            locations.append([entry['offset'], entry['length']])
+        else:
+            locations.append(None)
+    return part_sizes, locations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the sharded static search index and search.html')
+    parser.add_argument('--input', '-i', action='append', metavar='GLOB',
+                        help='story page(s) to index, in order; repeatable (default: %s)'
+                        % ' '.join(DEFAULT_SOURCES))
+    parser.add_argument('--out-dir', '-o', default=SEARCH_DIR,
+                        help='directory for the index files (default: %(default)s)')
+    parser.add_argument('--manifest', default=MANIFEST_FILE,
+                        help='split manifest with the stories\' byte locations (default: %(default)s)')
+    parser.add_argument('--query', '-q', help='after building, print the top matches for this query')
+    args = parser.parse_args()
+
+    corpus = Corpus(*(args.input or DEFAULT_SOURCES))
+    if not corpus.files:
+        raise SystemExit("No story pages found")
+
+    start = time.perf_counter()
+    docs, shards = build_index(corpus)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    part_sizes, locations = story_locations(docs, args.manifest)
+    unlocated = locations.count(None)
+    if unlocated:
+        print(f"{unlocated} of {len(docs)} stories are not in {args.manifest} as the parts are now; "
+              "search.html will link to their part (re-run split-stories-correct.py to fix)")
+    stories = [doc + (location or [None, None]) for doc, location in zip(docs, locations)]
+    meta = {'version': INDEX_VERSION, 'shardPrefix': SHARD_PREFIX, 'otherShard': OTHER_SHARD, 'k1': K1, 'b': B,
+            'stopWords': sorted(STOP_WORDS), 'shards': sorted(shards), 'parts': part_sizes, 'stories': stories}
+    outputs = {META_FILE: meta}
+    outputs.update((f'terms-{key}.json', terms) for key, terms in shards.items())
+    written = 0
+    total = 0
+    largest = 0
+    for name, data in outputs.items():
+        text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        written += write_if_changed(os.path.join(args.out_dir, name), text)
+        size = len(text.encode('utf-8'))
+        total += size
+        if name != META_FILE:
+            largest = max(largest, size)
+
+    # Shards left over from a corpus with other words
+    for name in os.listdir(args.out_dir):
+        if SHARD_NAME.fullmatch(name) and name not in outputs:
+            os.remove(os.path.join(args.out_dir, name))
+
+    page = SEARCH_HTML % {'search_dir': args.out_dir.rstrip('/').replace(os.sep, '/'), 'meta_file': META_FILE}
+    write_if_changed(SEARCH_PAGE, page)
+
+    terms = sum(len(terms) for terms in shards.values())
+    meta_size = os.path.getsize(os.path.join(args.out_dir, META_FILE))
+    print(f"Indexed {len(docs)} stories: {terms} terms in {len(shards)} shards, {total / 1024:.0f}KB "
+          f"(meta.json {meta_size / 1024:.0f}KB, largest shard {largest / 1024:.0f}KB); "
+          f"{written} files written in {time.perf_counter() - start:.1f}s")
+    print(f"Created {SEARCH_PAGE}")
+
+    if args.query:
+        for number, score in search(docs, shards, args.query):
+            title, part, theme, _ = docs[number - 1]
+            print(f"{score:7.2f}  {number:>5}  {title} ({theme or '-'}) in {part}")
+
+
+if __name__ == '__main__':
+    main()
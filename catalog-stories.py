@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Load the stories into a SQLite catalog and query it.
+
+Every run first refreshes stories.db from the part files, reparsing only
+parts that changed (see stories/catalog.py), then answers the question
+asked, if any:
+
+    python3 catalog-stories.py                      # load / refresh only
+    python3 catalog-stories.py --story 734          # which part holds it
+    python3 catalog-stories.py --theme 'friendly dragons and castles'
+    python3 catalog-stories.py --themes
+    python3 catalog-stories.py --search 'golden egg'
+"""
+
+import argparse
+import time
+
+from stories import DEFAULT_SOURCES, Catalog, source_files
+
+DEFAULT_DATABASE = 'stories.db'
+
+
+def print_stories(rows):
+    for row in rows:
+        print(f"{row['number']:>5}  {row['part']}  {row['title']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load the stories into a SQLite catalog and query it')
+    parser.add_argument('--input', '-i', action='append', metavar='GLOB',
+                        help='story page(s) to catalog, in order; repeatable (default: %s)'
+                        % ' '.join(DEFAULT_SOURCES))
+    parser.add_argument('--db', default=DEFAULT_DATABASE, help='database file (default: %(default)s)')
+    parser.add_argument('--story', type=int, metavar='N', help='show story N and the part that holds it')
+    parser.add_argument('--title', help='list the stories with this title')
+    parser.add_argument('--theme', help='list the stories with this theme')
+    parser.add_argument('--themes', action='store_true', help='list the themes by number of stories')
+    parser.add_argument('--search', metavar='QUERY',
+                        help='full-text search of titles and text for stories with all these words')
+    parser.add_argument('--limit', type=int, default=20, help='most search results to show (default: %(default)s)')
+    args = parser.parse_args()
+
+    paths = source_files(args.input or DEFAULT_SOURCES)
+    if not paths:
+        raise SystemExit("No story pages found")
+
+    with Catalog(args.db) as catalog:
+        start = time.perf_counter()
+        loaded = catalog.refresh(paths)
+        print(f"{args.db}: {len(catalog)} stories from {len(paths)} files "
+              f"({len(loaded)} reloaded in {time.perf_counter() - start:.2f}s)")
+
+        if args.story is not None:
+            story = catalog.story(args.story)
+            if story is None:
+                raise SystemExit(f"No story {args.story}")
+            print(f"Story {story['number']}: {story['title']}")
+            print(f"  part: {story['part']} (story {story['position'] + 1} in the file)")
+            print(f"  theme: {story['theme'] or '-'}")
+            print(f"  illustration: {story['image'] or '-'}")
+            print(f"  text: {len(story['text'])} characters")
+        if args.title:
+            print_stories(catalog.by_title(args.title))
+        if args.theme:
+            print_stories(catalog.by_theme(args.theme))
+        if args.themes:
+            for row in catalog.themes():
+                print(f"{row['stories']:>5}  {row['name']}")
+        if args.search:
+            if not catalog.has_search:
+                raise SystemExit("This SQLite was built without FTS5, so there is no search index")
+            for row in catalog.search(args.search, args.limit):
+                print(f"{row['number']:>5}  {row['part']}  {row['title']}: {row['snippet']}")
+
+
+if __name__ == '__main__':
+    main()
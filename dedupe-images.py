@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""Find duplicate images under images/ and point every page at one copy.
+
+Images with the same bytes, or (with Pillow) the same dimensions and
+nearly the same pixels in any encoding, are grouped using the image
+index (image_index.py). With --apply the smallest copy of each group is written once as
+images/<sha256>.<ext>, which story_server.py serves as immutable, and the
+references in the site's HTML, CSS and JS are rewritten to it, so the
+browser downloads and caches the picture once instead of once per name.
+--delete then removes the old names. Pages that build image URLs at run
+time (e.g. games.html's `images/${filename}`) aren't seen, so check the
+report before deleting.
+
+    python3 dedupe-images.py            # report only
+    python3 dedupe-images.py --apply --delete
+"""
+
+import argparse
+import glob
+import os
+import re
+from collections import defaultdict
+from urllib.parse import quote
+
+from image_index import DEFAULT_INPUTS, IMAGE_ROOT, INDEX_FILE, image_files, load_index, save_index, update_index
+from stories import source_files
+from story_images import EXTENSIONS, STORY_IMAGE_DIR, write_file, write_image
+
+try:
+    from PIL import Image
+except ImportError:  # without Pillow only byte-identical images are merged
+    Image = None
+
+# Pages whose image references are rewritten
+PAGE_PATTERNS = ('**/*.html', '**/*.css', '**/*.js')
+SKIP_DIRS = ('.git', 'node_modules', IMAGE_ROOT)
+
+
+# Pictures whose difference hashes differ in more of their 256 bits than
+# this are never the same picture
+HASH_DISTANCE = 16
+# Nor are ones whose 32x32 thumbnails differ by more than this per channel,
+# on average; re-encoding a picture stays well under it
+PIXEL_TOLERANCE = 3
+
+
+def perceptual_hash(path):
+    """(difference hash, 32x32 RGBA thumbnail bytes) of an image, or None if it can't be compared that way.
+
+    The hash is the sign of the brightness step between neighbouring pixels
+    of a 17x16 grayscale copy, so it survives re-encoding and format changes.
+    """
+    try:
+        with Image.open(path) as image:
+            if getattr(image, 'n_frames', 1) > 1:
+                # Only the first frame would be compared
+                return None
+            image = image.convert('RGBA')
+            gray = image.convert('L').resize((17, 16), Image.LANCZOS).tobytes()
+            thumbnail = image.resize((32, 32), Image.LANCZOS).tobytes()
+    except (OSError, ValueError):
+        return None
+    bits = 0
+    for row in range(16):
+        for column in range(16):
+            bits = bits << 1 | (gray[row * 17 + column] > gray[row * 17 + column + 1])
+    return bits, thumbnail
+
+
+def same_picture(first, second):
+    """Whether two perceptual_hash results are close enough to be one picture."""
+    if bin(first[0] ^ second[0]).count('1') > HASH_DISTANCE:
+        return False
+    difference = sum(abs(a - b) for a, b in zip(first[1], second[1]))
+    return difference <= PIXEL_TOLERANCE * len(first[1])
+
+
+def duplicate_groups(index, paths):
+    """Return lists of paths (two or more) holding the same picture.
+
+    Files are grouped by their bytes first. With Pillow, distinct files with
+    the same dimensions, whatever their format, are then compared by a
+    perceptual hash and a thumbnail within a small tolerance, so a PNG and a
+    re-encoded JPEG of one picture are merged, but a crop or a resize is not.
+    """
+    by_digest = defaultdict(list)
+    for path in paths:
+        by_digest[index['files'][path]['images'][0]].append(path)
+
+    groups = list(by_digest.values())
+    if Image is not None:
+        by_shape = defaultdict(list)
+        for digest, members in by_digest.items():
+            info = index['images'][digest]
+            if info['format'] is not None:
+                by_shape[info['width'], info['height']].append(members)
+        for candidates in by_shape.values():
+            if len(candidates) < 2:
+                continue
+            # Each picture joins the first cluster whose first member it matches
+            clusters = []
+            for members in candidates:
+                signature = perceptual_hash(members[0])
+                if signature is None:
+                    continue
+                groups.remove(members)
+                for cluster in clusters:
+                    if same_picture(cluster[0], signature):
+                        cluster[1].extend(members)
+                        break
+                else:
+                    clusters.append((signature, list(members)))
+            groups.extend(merged for _, merged in clusters)
+    return sorted((sorted(group) for group in groups if len(group) > 1), key=lambda group: group[0])
+
+
+def page_files(root='.'):
+    paths = set()
+    for pattern in PAGE_PATTERNS:
+        for path in glob.glob(os.path.join(root, pattern), recursive=True):
+            parts = os.path.relpath(path, root).split(os.sep)
+            if not any(part in SKIP_DIRS for part in parts[:-1]) and os.path.isfile(path):
+                paths.add(path)
+    return sorted(paths)
+
+
+def rewrite_references(page, renames):
+    """Point the image URLs in page at their canonical files; return how many changed.
+
+    renames maps old image paths to canonical ones, both relative to the cwd.
+    A URL counts when it is quoted, in url(...) or follows '='/whitespace,
+    written relative to the page, with or without ./ and percent-encoding.
+    The page is read and written at most once, however many images moved.
+    """
+    try:
+        with open(page, 'r', encoding='utf-8', newline='') as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError):
+        return 0
+
+    page_dir = os.path.dirname(page) or '.'
+    targets = {}
+    for old, new in renames.items():
+        old_url = os.path.relpath(old, page_dir).replace(os.sep, '/')
+        new_url = os.path.relpath(new, page_dir).replace(os.sep, '/')
+        for url in {old_url, quote(old_url)}:
+            if url in text:
+                targets[url] = new_url
+    if not targets:
+        return 0
+
+    # Longest first, so a name that is a prefix of another doesn't match its start
+    urls = '|'.join(re.escape(url) for url in sorted(targets, key=len, reverse=True))
+    pattern = re.compile(r'''(["'(=\s`](?:\./)?)(''' + urls + r''')(?=["')\s`?#])''')
+    text, count = pattern.subn(lambda match: match.group(1) + targets[match.group(2)], text)
+    if count:
+        write_file(page, text)
+    return count
+
+
+def pages_naming(pages, names):
+    """Map each of names to the pages whose text mentions it anywhere, reading each page once."""
+    named = {name: [] for name in names}
+    for page in pages:
+        with open(page, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        for name, found in named.items():
+            if name in text:
+                found.append(page)
+    return named
+
+
+def canonical_file(index, group, image_dir):
+    """Write the smallest copy in group as image_dir/<sha256>.<ext> and return that path."""
+    source = min(group, key=lambda path: (index['images'][index['files'][path]['images'][0]]['bytes'], path))
+    fmt = index['images'][index['files'][source]['images'][0]]['format']
+    extension = EXTENSIONS.get(fmt) or os.path.splitext(source)[1].lstrip('.').lower()
+    with open(source, 'rb') as f:
+        return write_image(f.read(), extension, image_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Merge duplicate images under images/ into content-addressed files')
+    parser.add_argument('--images', default=IMAGE_ROOT, help='directory to deduplicate (default: %(default)s)')
+    parser.add_argument('--root', default='.', help='site directory whose pages are rewritten (default: current)')
+    parser.add_argument('--index', default=INDEX_FILE, help='image index to use and update (default: %(default)s)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='index this many files in parallel (default: %(default)s)')
+    parser.add_argument('--apply', action='store_true',
+                        help='write the canonical files and rewrite references (default: only report)')
+    parser.add_argument('--delete', action='store_true',
+                        help='with --apply, remove the duplicate names no page still refers to')
+    args = parser.parse_args()
+    if args.delete and not args.apply:
+        parser.error('--delete needs --apply')
+
+    # The story illustrations are already content-addressed
+    stories_dir = os.path.normpath(STORY_IMAGE_DIR)
+    images = sorted(path for path in image_files(args.images)
+                    if not os.path.normpath(path).startswith(stories_dir + os.sep))
+    if not images:
+        raise SystemExit(f"No images found under {args.images}")
+
+    # Index the parts too, so the shared index keeps their entries
+    index = load_index(args.index)
+    update_index(index, source_files(DEFAULT_INPUTS) + image_files(args.images), args.jobs)
+    save_index(index, args.index)
+
+    groups = duplicate_groups(index, images)
+    if not groups:
+        print(f"No duplicates among {len(images)} images")
+        return
+
+    reclaimed = 0
+    renames = {}
+    for group in groups:
+        sizes = [index['images'][index['files'][path]['images'][0]]['bytes'] for path in group]
+        saved = sum(sizes) - min(sizes)
+        reclaimed += saved
+        print(f"{len(group)} copies, {saved / (1024 * 1024):.2f}MB duplicated: {', '.join(group)}")
+        if args.apply:
+            canonical = canonical_file(index, group, args.images)
+            print(f"  -> {canonical}")
+            renames.update((path, canonical) for path in group if path != canonical)
+
+    if renames:
+        # Every page is rewritten once with all the renames together
+        pages = page_files(args.root)
+        for page in pages:
+            count = rewrite_references(page, renames)
+            if count:
+                print(f"{page}: {count} reference{'s' if count != 1 else ''} rewritten")
+        if args.delete:
+            still_used = pages_naming(pages, {os.path.basename(path) for path in renames})
+            for path in renames:
+                named = still_used[os.path.basename(path)]
+                if named:
+                    print(f"kept {path}: still named in {', '.join(named)}")
+                else:
+                    os.remove(path)
+                    print(f"removed {path}")
+
+    print(f"{len(groups)} duplicate group{'s' if len(groups) != 1 else ''}, "
+          f"{reclaimed / (1024 * 1024):.2f}MB reclaimable"
+          + ("" if args.apply else " (run with --apply to merge them)"))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,56 @@
+import argparse
+import glob
+import io
+import json
+import math
 import os
+import re
+import textwrap
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-input_file = 'illustrated-stories-5.html'
-output_file = 'illustrated-stories-flipbook.html'
+from site_assets import share_inline
+from story_images import (externalize_images, file_digest, illustration_bytes, image_src, lazy_image_tag,
+                          lazy_images, rebase_images)
+from story_tokenizer import StoryTokenizer, story_theme, story_title
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is only needed for the index thumbnails
+    Image = None
+
+DEFAULT_INPUTS = ('illustrated-stories-part-*.html',)
+OUTPUT_SUFFIX = '-flipbook'
+# Records what each flipbook in --out-dir was built from
+STATE_FILE = '.flipbook-state.json'
+STATE_VERSION = 2
+# Modules whose changes also change the output
+BUILD_MODULES = ('site_assets.py', 'story_images.py', 'story_tokenizer.py')
+
+# Copy the single-file flipbook through in 1MB chunks
+CHUNK_SIZE = 1024 * 1024
+HEAD_END = b'</head>'
+BODY_END = b'</body>'
+
+# Page budgets for the paginated build's page layout: a page of text at the
+# story font (16px Georgia, line-height 1.8) on a ~600x500px page, which is
+# about what #book leaves on a small tablet. Bigger screens get some room
+# at the bottom, smaller ones scroll a little.
+LINE_CHARS = 64
+PAGE_LINES = 16
+# Room the title and theme take at the top of a story's first page
+HEADING_LINES = 4
+
+STORY_CONTENT = re.compile(r'<div class="story-content">(.*?)</div>', re.DOTALL)
+IMG_ALT = re.compile(r'<img\b[^>]*?\salt="([^"]*)"')
+
+# Jump-to-story index: index.json with the titles, and sprite sheets of
+# THUMB_SIZE px thumbnails (a 10x10 sheet of 100 stories is about 30KB)
+INDEX_FILE = 'index.json'
+THUMB_SIZE = 32
+THUMB_COLUMNS = 10
+THUMBS_PER_SPRITE = 100
+SPRITE_FORMATS = (('WEBP', 'webp', {'quality': 40, 'method': 6}), ('JPEG', 'jpg', {'quality': 60, 'optimize': True}))
+SPRITE_NAME = re.compile(r'thumbs-\d+\.(webp|jpg)')
 
 flipbook_styles = """
 <style id="flipbook-styles">
@@ -80,6 +129,65 @@ flipbook_styles = """
     
     /* Z-index management is handled by JS */
 
+    /* Jump-to-story panel */
+    #story-index {
+        position: fixed;
+        top: 80px;
+        bottom: 110px;
+        left: 50%;
+        transform: translateX(-50%);
+        width: min(90vw, 800px);
+        z-index: 10001;
+        overflow-y: auto;
+        background: rgba(255,255,255,0.97);
+        border-radius: 10px;
+        box-shadow: 0 5px 20px rgba(0,0,0,0.3);
+        padding: 15px;
+        box-sizing: border-box;
+        display: grid;
+        grid-template-columns: repeat(auto-fill, minmax(220px, 1fr));
+        gap: 6px;
+        align-content: start;
+    }
+
+    .story-index-item {
+        display: flex;
+        align-items: center;
+        gap: 10px;
+        padding: 6px;
+        border: none;
+        border-radius: 6px;
+        background: none;
+        font-family: 'Georgia', serif;
+        font-size: 0.9em;
+        text-align: left;
+        cursor: pointer;
+    }
+    .story-index-item:hover { background: #ffe4b3; }
+
+    .story-thumb {
+        flex: none;
+        border-radius: 4px;
+        background-color: #e6d1a3;
+        background-repeat: no-repeat;
+    }
+
+    /* Picture page of a laid-out story (paginated build) */
+    .page-illustration {
+        flex: 1;
+        min-height: 0;
+        display: flex;
+        justify-content: center;
+        align-items: center;
+    }
+    .page-illustration img {
+        max-width: 100%;
+        max-height: 100%;
+        object-fit: contain;
+        border-radius: 8px;
+        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+    }
+
     .controls {
         position: fixed;
         bottom: 30px;
@@ -151,8 +259,117 @@ flipbook_styles = """
 </style>
 """
 
+# How many pages either side of the current one the reader keeps in the DOM
+PAGES_BEHIND = 1
+PAGES_AHEAD = 2
+
+page_window_js = """
+// Only the pages around the current one are kept in the DOM. Pages that fall
+// out of the window are emptied and their elements reused for the pages that
+// come into it, so the DOM stays the same size however long the book is.
+const PAGES_BEHIND = %d;
+const PAGES_AHEAD = %d;
+
+function createPageWindow(book, pageCount, renderPage) {
+    const live = new Map(); // page index -> element
+    const spare = [];
+
+    function show(current) {
+        const first = Math.max(0, current - PAGES_BEHIND);
+        const last = Math.min(pageCount - 1, current + PAGES_AHEAD);
+
+        live.forEach((page, index) => {
+            if (index < first || index > last) {
+                page.remove();
+                page.innerHTML = '';
+                live.delete(index);
+                spare.push(page);
+            }
+        });
+
+        for (let index = first; index <= last; index++) {
+            const page = live.get(index);
+            if (page) {
+                // Toggling in place animates the flip
+                page.classList.toggle('flipped', index < current);
+                continue;
+            }
+            const fresh = spare.pop() || document.createElement('div');
+            fresh.className = index < current ? 'page flipped' : 'page';
+            fresh.dataset.page = index;
+            // Reverse z-index so first pages are on top
+            fresh.style.zIndex = pageCount - index;
+            renderPage(index, fresh);
+            live.set(index, fresh);
+            book.appendChild(fresh);
+        }
+    }
+
+    return { show };
+}
+""" % (PAGES_BEHIND, PAGES_AHEAD)
+
+story_index_js = """
+// Jump-to-story panel. The titles and thumbnail sprites come from the JSON
+// named by <meta name="flipbook-index">, fetched the first time the panel
+// opens; the panel's elements only exist while it is open.
+function createStoryIndex(button, jumpTo) {
+    const meta = document.querySelector('meta[name="flipbook-index"]');
+    if (!meta) {
+        button.remove();
+        return;
+    }
+    const indexUrl = new URL(meta.content, document.baseURI);
+    let index = null;
+    let panel = null;
+
+    function close() {
+        if (panel) panel.remove();
+        panel = null;
+    }
+
+    async function open() {
+        panel = document.createElement('div');
+        panel.id = 'story-index';
+        document.body.appendChild(panel);
+        if (!index) index = await fetch(indexUrl).then(response => response.json());
+        if (!panel) return; // closed while loading
+
+        const size = index.thumb_size;
+        index.stories.forEach((story, i) => {
+            const item = document.createElement('button');
+            item.className = 'story-index-item';
+            const thumb = document.createElement('span');
+            thumb.className = 'story-thumb';
+            thumb.style.width = thumb.style.height = `${size}px`;
+            const sprite = index.sprites[Math.floor(i / index.per_sprite)];
+            if (story.thumb && sprite) {
+                const cell = i % index.per_sprite;
+                thumb.style.backgroundImage = `url("${new URL(sprite, indexUrl)}")`;
+                thumb.style.backgroundPosition = `-${(cell % index.columns) * size}px -${Math.floor(cell / index.columns) * size}px`;
+            }
+            const label = document.createElement('span');
+            label.textContent = `${i + 1}. ${story.title}`;
+            item.title = story.theme;
+            item.append(thumb, label);
+            item.addEventListener('click', () => {
+                close();
+                jumpTo(i);
+            });
+            panel.appendChild(item);
+        });
+    }
+
+    button.addEventListener('click', () => panel ? close() : open());
+    document.addEventListener('keydown', (e) => {
+        if (e.key === 'Escape') close();
+    });
+}
+"""
+
 flipbook_script = """
 <script>
+""" + page_window_js + story_index_js + """
 document.addEventListener('DOMContentLoaded', function() {
     const originalWrapper = document.querySelector('.content-wrapper');
     if (!originalWrapper) return;
@@ -175,62 +392,43 @@ document.addEventListener('DOMContentLoaded', function() {
         <button id="prevBtn" class="btn">← Previous</button>
         <span id="pageInfo">Cover</span>
         <button id="nextBtn" class="btn">Next →</button>
+        <button id="indexBtn" class="btn">Stories</button>
     `;
     body.appendChild(controls);
 
     // Extract Stories
     const stories = Array.from(originalWrapper.querySelectorAll('.story'));
     const title = originalWrapper.querySelector('h1') ? originalWrapper.querySelector('h1').innerText : 'Stories';
-    
-    // Create Cover Page
-    const coverPage = document.createElement('div');
-    coverPage.className = 'page cover';
-    coverPage.style.zIndex = stories.length + 2;
-    coverPage.innerHTML = `
-        <h1>${title}</h1>
-        <h2>A Collection of ${stories.length} Stories</h2>
-        <p>Click Next to begin reading</p>
-    `;
-    book.appendChild(coverPage);
-
-    // Create Story Pages
-    stories.forEach((story, index) => {
-        const page = document.createElement('div');
-        page.className = 'page';
-        // Reverse z-index so first pages are on top
-        page.style.zIndex = stories.length - index; 
-        
+    const pageCount = stories.length + 1; // cover + stories
+
+    function renderPage(index, page) {
+        if (index === 0) {
+            page.classList.add('cover');
+            page.innerHTML = `
+                <h1>${title}</h1>
+                <h2>A Collection of ${stories.length} Stories</h2>
+                <p>Click Next to begin reading</p>
+            `;
+            return;
+        }
+
         // Copy content
-        page.innerHTML = story.innerHTML;
-        
+        page.innerHTML = stories[index - 1].innerHTML;
+
         // Add page number
         const pageNum = document.createElement('div');
         pageNum.className = 'page-number';
-        pageNum.innerText = index + 1;
+        pageNum.innerText = index;
         page.appendChild(pageNum);
-        
-        book.appendChild(page);
-    });
+    }
 
     // Logic
-    const pages = Array.from(document.querySelectorAll('.page'));
+    const pageWindow = createPageWindow(book, pageCount, renderPage);
     let currentPage = 0; // 0 is cover
 
-    function updateZIndexes() {
-        pages.forEach((page, index) => {
-            if (index < currentPage) {
-                // Flipped pages
-                page.style.zIndex = index; 
-            } else {
-                // Unflipped pages
-                page.style.zIndex = pages.length - index;
-            }
-        });
-    }
-
     function updateControls() {
         document.getElementById('prevBtn').disabled = currentPage === 0;
-        document.getElementById('nextBtn').disabled = currentPage === pages.length;
+        document.getElementById('nextBtn').disabled = currentPage === pageCount;
         
         let label = "";
         if (currentPage === 0) label = "Cover";
@@ -241,28 +439,30 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function flipNext() {
-        if (currentPage < pages.length) {
-            pages[currentPage].classList.add('flipped');
+        if (currentPage < pageCount) {
             currentPage++;
+            pageWindow.show(currentPage);
             updateControls();
-            // updateZIndexes is not strictly needed if we handle z-index initially correctly, 
-            // but for 3D effect, the flipped page should go 'behind' the current stack?
-            // With transform rotateY(-180deg), it flips to the left.
-            // We need to make sure it doesn't obscure the next page if it has a backface.
-            // But we set backface-visibility: hidden.
         }
     }
 
     function flipPrev() {
         if (currentPage > 0) {
             currentPage--;
-            pages[currentPage].classList.remove('flipped');
+            pageWindow.show(currentPage);
             updateControls();
         }
     }
 
+    function jumpTo(story) {
+        currentPage = story + 1;
+        pageWindow.show(currentPage);
+        updateControls();
+    }
+
     document.getElementById('nextBtn').addEventListener('click', flipNext);
     document.getElementById('prevBtn').addEventListener('click', flipPrev);
+    createStoryIndex(document.getElementById('indexBtn'), jumpTo);
     
     // Keyboard navigation
     document.addEventListener('keydown', (e) => {
@@ -270,37 +470,699 @@ document.addEventListener('DOMContentLoaded', function() {
         if (e.key === 'ArrowLeft') flipPrev();
     });
 
+    pageWindow.show(currentPage);
     updateControls();
 });
 </script>
 """
 
-try:
-    print(f"Reading {input_file}...")
+paginated_script = """
+<script>
+""" + page_window_js + story_index_js + """
+document.addEventListener('DOMContentLoaded', function() {
+    // Pages live in JSON chunks next to this page; only the chunks around
+    // the current page are fetched and kept
+    const book = document.getElementById('book');
+    const storyCount = Number(book.dataset.stories);
+    const chunkSize = Number(book.dataset.chunkSize);
+    const chunkUrl = book.dataset.chunkUrl;
+    const originalWrapper = document.querySelector('.content-wrapper');
+    const title = originalWrapper && originalWrapper.querySelector('h1') ? originalWrapper.querySelector('h1').innerText : 'Stories';
+
+    // Stories were split into pages at build time; find where each one starts
+    const storyPages = book.dataset.storyPages ? book.dataset.storyPages.split(',').map(Number) : [];
+    const storyStarts = [];
+    let pageCount = 1; // the cover
+    storyPages.forEach(count => {
+        storyStarts.push(pageCount);
+        pageCount += count;
+    });
+
+    function storyAt(index) {
+        let low = 0;
+        let high = storyStarts.length - 1;
+        while (low < high) {
+            const mid = (low + high + 1) >> 1;
+            if (storyStarts[mid] <= index) low = mid;
+            else high = mid - 1;
+        }
+        return low;
+    }
+
+    const chunks = new Map();
+    const failedPages = new Set();
+    let currentPage = 0; // 0 is cover
+
+    function loadChunk(index) {
+        if (!chunks.has(index)) {
+            const url = chunkUrl.replace('{chunk}', String(index).padStart(4, '0'));
+            const chunk = fetch(url).then(response => {
+                if (!response.ok) throw new Error(`${url}: HTTP ${response.status}`);
+                return response.json();
+            }).catch(error => {
+                // Forget the failure so the next page turn fetches it again
+                if (chunks.get(index) === chunk) chunks.delete(index);
+                throw error;
+            });
+            chunks.set(index, chunk);
+        }
+        return chunks.get(index);
+    }
+
+    function renderPage(index, page) {
+        if (index === 0) {
+            page.classList.add('cover');
+            page.innerHTML = `
+                <h1>${title}</h1>
+                <h2>A Collection of ${storyCount} Stories</h2>
+                <p>Click Next to begin reading</p>
+            `;
+            return;
+        }
+
+        const position = index - 1;
+        page.innerHTML = '<p>Loading...</p>';
+        failedPages.delete(page);
+        loadChunk(Math.floor(position / chunkSize)).then(chunk => {
+            // The element may have been reused for another page meanwhile
+            if (page.dataset.page !== String(index)) return;
+            page.innerHTML = chunk[position % chunkSize];
+            const pageNum = document.createElement('div');
+            pageNum.className = 'page-number';
+            pageNum.innerText = index;
+            page.appendChild(pageNum);
+        }).catch(() => {
+            if (page.dataset.page !== String(index)) return;
+            page.innerHTML = '<p>This page could not be loaded. Turn the page to try again.</p>';
+            failedPages.add(page);
+        });
+    }
+
+    const pageWindow = createPageWindow(book, pageCount, renderPage);
+
+    function prepare() {
+        pageWindow.show(currentPage);
+        // Pages still in view whose chunk failed to load are retried on every turn
+        failedPages.forEach(page => {
+            if (page.parentNode === book) renderPage(Number(page.dataset.page), page);
+            else failedPages.delete(page);
+        });
+        // Warm the next chunk near the end of this one, and drop chunks
+        // the reader has moved away from
+        const position = Math.max(0, currentPage - 1);
+        const current = Math.floor(position / chunkSize);
+        if ((current + 1) * chunkSize < pageCount - 1 && position % chunkSize > chunkSize / 2) {
+            loadChunk(current + 1).catch(() => {});
+        }
+        chunks.forEach((chunk, index) => {
+            if (Math.abs(index - current) > 1) chunks.delete(index);
+        });
+    }
+
+    function updateControls() {
+        document.getElementById('prevBtn').disabled = currentPage === 0;
+        document.getElementById('nextBtn').disabled = currentPage === pageCount;
+
+        let label = "";
+        if (currentPage === 0) label = "Cover";
+        else if (currentPage >= pageCount) label = "End";
+        else {
+            const story = storyAt(currentPage);
+            label = `Story ${story + 1} of ${storyCount}`;
+            if (storyPages[story] > 1) label += `, page ${currentPage - storyStarts[story] + 1} of ${storyPages[story]}`;
+        }
+
+        document.getElementById('pageInfo').innerText = label;
+    }
+
+    function flipNext() {
+        if (currentPage < pageCount) {
+            currentPage++;
+            prepare();
+            updateControls();
+        }
+    }
+
+    function flipPrev() {
+        if (currentPage > 0) {
+            currentPage--;
+            prepare();
+            updateControls();
+        }
+    }
+
+    function jumpTo(story) {
+        currentPage = storyStarts[story];
+        prepare();
+        updateControls();
+    }
+
+    document.getElementById('nextBtn').addEventListener('click', flipNext);
+    document.getElementById('prevBtn').addEventListener('click', flipPrev);
+    createStoryIndex(document.getElementById('indexBtn'), jumpTo);
+
+    // Keyboard navigation
+    document.addEventListener('keydown', (e) => {
+        if (e.key === 'ArrowRight') flipNext();
+        if (e.key === 'ArrowLeft') flipPrev();
+    });
+
+    prepare();
+    updateControls();
+});
+</script>
+"""
+
+paginated_body = """
+  </div>
+  <div id="flipbook-container">
+    <div id="book" data-stories="{stories}" data-story-pages="{story_pages}" data-chunk-size="{chunk_size}" data-chunk-url="{chunk_url}"></div>
+  </div>
+  <div class="controls">
+    <button id="prevBtn" class="btn">← Previous</button>
+    <span id="pageInfo">Cover</span>
+    <button id="nextBtn" class="btn">Next →</button>
+    <button id="indexBtn" class="btn">Stories</button>
+  </div>
+"""
+
+
+def page_illustration(illustration, source_dir='.', base_dir='.'):
+    """A story's picture as a flipbook in base_dir shows it.
+
+    Base64 images are written to base_dir/images/stories/, and srcs relative
+    to the source page in source_dir are made relative to base_dir.
+    """
+    if os.path.abspath(source_dir) != os.path.abspath(base_dir):
+        illustration = rebase_images(illustration, source_dir, base_dir)
+    return externalize_images(illustration, base_dir=base_dir)
+
+
+def story_page_html(story, illustration, source_dir='.', base_dir='.'):
+    """Inner HTML of a story page: the story's contents followed by its picture."""
+    inner = story[story.index('>') + 1:story.rindex('</div>')]
+    return inner + page_illustration(illustration, source_dir, base_dir)
+
+
+def paginate_text(text, first_page_lines=PAGE_LINES):
+    """Split pre-wrapped story text into pages of at most PAGE_LINES lines.
+
+    Lines are counted by wrapping each paragraph at LINE_CHARS. A paragraph
+    that doesn't fit is split between two lines and carries on at the top of
+    the next page; blank lines never start a page.
+    """
+    pages = []
+    page = ''
+    lines = 0
+    budget = first_page_lines
+    for paragraph in text.strip().split('\n'):
+        wrapped = textwrap.wrap(paragraph, LINE_CHARS, break_long_words=False, break_on_hyphens=False) or ['']
+        for i, line in enumerate(wrapped):
+            if lines >= budget:
+                pages.append(page)
+                page = ''
+                lines = 0
+                budget = PAGE_LINES
+            if lines == 0 and not line:
+                continue
+            if lines:
+                page += ' ' if i else '\n'
+            page += line
+            lines += 1
+    if page:
+        pages.append(page)
+    return pages
+
+
+def layout_story(story, illustration, source_dir='.', base_dir='.'):
+    """Split a story into the inner HTML of its flipbook pages.
+
+    A story with a picture opens on its title, theme and the picture scaled
+    to fit the page, and its text follows on pages of PAGE_LINES lines.
+    Without a picture the text starts under the title. A story whose content
+    isn't plain text is left on one page. Image srcs are relative to
+    base_dir, where the flipbook goes (see page_illustration).
+    """
+    content = STORY_CONTENT.search(story)
+    if content is None or '<' in content.group(1):
+        return [story_page_html(story, illustration, source_dir, base_dir)]
+
+    heading = story[story.index('>') + 1:content.start()]
+    pages = []
+    text_lines = PAGE_LINES - HEADING_LINES
+    src = image_src(page_illustration(illustration, source_dir, base_dir))
+    if src is not None:
+        alt = IMG_ALT.search(illustration)
+        img = lazy_image_tag(f'<img src="{src}" alt="{alt.group(1) if alt else ""}" class="story-image">',
+                             base_dir)
+        pages.append(f'{heading}<div class="page-illustration">{img}</div>')
+        heading = ''
+        text_lines = PAGE_LINES
+    for text in paginate_text(content.group(1), text_lines):
+        pages.append(f'{heading}<div class="story-content">{text}</div>')
+        heading = ''
+    return pages or [story_page_html(story, illustration, source_dir, base_dir)]
+
+
+def story_thumbnail(illustration, base_dir):
+    """Return a THUMB_SIZE square thumbnail of a story's picture, or None."""
+    if Image is None or not illustration:
+        return None
+    data = illustration_bytes(illustration, base_dir)
+    if data is None:
+        return None
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Lets JPEG decode at a fraction of full size
+        image.draft('RGB', (THUMB_SIZE * 2, THUMB_SIZE * 2))
+        return ImageOps.fit(image.convert('RGB'), (THUMB_SIZE, THUMB_SIZE), Image.LANCZOS)
+    except (OSError, ValueError):
+        return None
+
+
+def index_entry(story, illustration, base_dir):
+    """Return ({title, theme}, thumbnail or None) for the jump index."""
+    return {'title': story_title(story), 'theme': story_theme(story)}, story_thumbnail(illustration, base_dir)
+
+
+def write_index(index_dir, entries, thumbs):
+    """Write index.json and thumbnail sprites for a flipbook's stories.
+
+    Every THUMBS_PER_SPRITE thumbnails share one sprite sheet, so the reader
+    fetches a handful of small images however many stories there are.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    sprites = []
+    if any(thumbs):
+        Image.init()
+        sprite_format, extension, options = next(fmt for fmt in SPRITE_FORMATS if fmt[0] in Image.SAVE)
+        for start in range(0, len(thumbs), THUMBS_PER_SPRITE):
+            batch = thumbs[start:start + THUMBS_PER_SPRITE]
+            if not any(batch):
+                sprites.append(None)
+                continue
+            rows = math.ceil(len(batch) / THUMB_COLUMNS)
+            sheet = Image.new('RGB', (THUMB_COLUMNS * THUMB_SIZE, rows * THUMB_SIZE), (230, 209, 163))
+            for cell, thumb in enumerate(batch):
+                if thumb is not None:
+                    sheet.paste(thumb, (cell % THUMB_COLUMNS * THUMB_SIZE, cell // THUMB_COLUMNS * THUMB_SIZE))
+            name = f'thumbs-{start // THUMBS_PER_SPRITE:04d}.{extension}'
+            sheet.save(os.path.join(index_dir, name), sprite_format, **options)
+            sprites.append(name)
+
+    # Sprites from an earlier, longer build
+    for name in os.listdir(index_dir):
+        if SPRITE_NAME.fullmatch(name) and name not in sprites:
+            os.remove(os.path.join(index_dir, name))
+
+    index = {
+        'thumb_size': THUMB_SIZE,
+        'columns': THUMB_COLUMNS,
+        'per_sprite': THUMBS_PER_SPRITE,
+        'sprites': sprites,
+        'stories': [{**entry, 'thumb': thumb is not None} for entry, thumb in zip(entries, thumbs)],
+    }
+    with open(os.path.join(index_dir, INDEX_FILE), 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+    return sum(os.path.getsize(os.path.join(index_dir, name)) for name in sprites if name)
+
+
+def index_meta(output_file):
+    """The <meta> that points a flipbook's reader at its index.json."""
+    index_dir = os.path.basename(os.path.splitext(output_file)[0])
+    return f'\n<meta name="flipbook-index" content="{index_dir}/{INDEX_FILE}">'
+
+
+def build_index(input_file, output_file):
+    """Collect the jump index for input_file in a pass of its own and write it."""
+    base_dir = os.path.dirname(input_file)
+    entries = []
+    thumbs = []
     with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read()
+        for story, illustration in StoryTokenizer(f):
+            entry, thumb = index_entry(story, illustration, base_dir)
+            entries.append(entry)
+            thumbs.append(thumb)
+    report_index(output_file, entries, thumbs)
 
-    print("Injecting styles...")
-    # Inject styles before </head>
-    if '</head>' in content:
-        content = content.replace('</head>', flipbook_styles + '</head>')
+
+def report_index(output_file, entries, thumbs):
+    index_dir = os.path.splitext(output_file)[0]
+    sprite_bytes = write_index(index_dir, entries, thumbs)
+    if Image is None:
+        print(f"Wrote a title index for {len(entries)} stories to {index_dir}/ "
+              f"(install Pillow for thumbnails)")
     else:
-        print("Warning: </head> not found, appending styles to body")
-        content += flipbook_styles
+        print(f"Wrote an index of {len(entries)} stories to {index_dir}/ "
+              f"with {sum(thumb is not None for thumb in thumbs)} thumbnails in {sprite_bytes / 1024:.1f}KB of sprites")
+
+
+def write_chunk(chunk_dir, index, pages):
+    with open(os.path.join(chunk_dir, f'pages-{index:04d}.json'), 'w', encoding='utf-8') as f:
+        json.dump(pages, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def page_assets(script, name, output_file, shared_assets=False):
+    """Return the (styles, script) blocks to add to a flipbook page.
+
+    With shared_assets they are <link>/<script src> tags for hashed files in
+    styles/ and js/ next to output_file, so every flipbook shares one copy.
+    """
+    if not shared_assets:
+        return flipbook_styles, script
+    root = os.path.dirname(output_file) or '.'
+    return share_inline(flipbook_styles, 'flipbook', root), share_inline(script, name, root)
+
+
+def build_paginated(input_file, output_file, pages_per_chunk, shared_assets=False, index=True):
+    """Write a small shell page plus JSON chunks of pages_per_chunk pages.
+
+    Stories are split into pages at build time (see layout_story). Chunks and
+    the jump index go in a directory named after output_file, and
+    illustrations are written to images/stories/ next to output_file so no
+    chunk carries base64.
+    """
+    source_dir = os.path.dirname(input_file) or '.'
+    base_dir = os.path.dirname(output_file) or '.'
+    chunk_dir = os.path.splitext(output_file)[0]
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    print(f"Reading {input_file}...")
+    story_pages = []
+    chunk_count = 0
+    entries = []
+    thumbs = []
+    with open(input_file, 'r', encoding='utf-8') as f:
+        tokens = StoryTokenizer(f)
+        header = tokens.header
+        chunk = []
+        for story, illustration in tokens:
+            if index:
+                entry, thumb = index_entry(story, illustration, source_dir)
+                entries.append(entry)
+                thumbs.append(thumb)
+            pages = layout_story(story, illustration, source_dir, base_dir)
+            story_pages.append(len(pages))
+            for page in pages:
+                chunk.append(page)
+                if len(chunk) == pages_per_chunk:
+                    write_chunk(chunk_dir, chunk_count, chunk)
+                    chunk_count += 1
+                    chunk = []
+        if chunk:
+            write_chunk(chunk_dir, chunk_count, chunk)
+            chunk_count += 1
+
+    # Chunks left over from a longer build would never be fetched
+    for name in os.listdir(chunk_dir):
+        match = re.fullmatch(r'pages-(\d+)\.json', name)
+        if match and int(match.group(1)) >= chunk_count:
+            os.remove(os.path.join(chunk_dir, name))
+
+    story_count = len(story_pages)
+    print(f"Wrote {story_count} stories as {sum(story_pages)} pages in {chunk_count} chunks to {chunk_dir}/")
+    if index:
+        report_index(output_file, entries, thumbs)
 
-    print("Injecting script...")
-    # Inject script before </body>
-    if '</body>' in content:
-        content = content.replace('</body>', flipbook_script + '</body>')
+    styles, script = page_assets(paginated_script, 'flipbook-paginated', output_file, shared_assets)
+    if index:
+        styles = index_meta(output_file) + styles
+    if shared_assets:
+        # Same name as split-stories-correct.py --shared-assets, so the parts'
+        # header styles and these are one file
+        header = share_inline(header, 'stories', os.path.dirname(output_file) or '.')
+    if '</head>' in header:
+        header = header.replace('</head>', styles + '</head>', 1)
     else:
-        print("Warning: </body> not found, appending script to end")
-        content += flipbook_script
+        print("Warning: </head> not found, adding styles at the top")
+        header = styles + header
+    chunk_url = f'{os.path.basename(chunk_dir)}/pages-{{chunk}}.json'
+    body = paginated_body.format(stories=story_count, story_pages=','.join(map(str, story_pages)),
+                                 chunk_size=pages_per_chunk, chunk_url=chunk_url)
 
     print(f"Writing to {output_file}...")
     with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(content)
-        
-    print("Done!")
+        f.write(header + body + script + '</body>\n</html>\n')
+    print(f"Done! Shell page is {os.path.getsize(output_file) / 1024:.1f}KB")
+
+
+def inject_streaming(src, dst, styles, script, chunk_size=CHUNK_SIZE):
+    """Copy src to dst in chunks, adding styles before the first </head> and
+    script before the last </body>.
+
+    Only the document's own closing tags are touched, not every occurrence,
+    and memory stays at one chunk. The last </body> is only known at the
+    end, so its output offset is remembered and the short tail after it is
+    read back from dst and rewritten behind the script once the copy is
+    done; dst must be opened for reading too. src only needs read(), so it
+    can transform the page on the way (see LazyImageReader). Returns (found
+    head, found body).
+    """
+    keep = max(len(HEAD_END), len(BODY_END)) - 1
+    pending = b''
+    out_pos = 0
+    head_found = False
+    last_body = None  # output offset of the last </body>
+
+    while True:
+        chunk = src.read(chunk_size)
+        data = pending + chunk
+        # Hold back a few bytes in case a tag straddles two chunks
+        emit_end = max(0, len(data) - keep) if chunk else len(data)
+        written = 0
+        search = 0
+        while True:
+            head = -1 if head_found else data.find(HEAD_END, search, emit_end + len(HEAD_END) - 1)
+            body = data.find(BODY_END, search, emit_end + len(BODY_END) - 1)
+            if head != -1 and (body == -1 or head < body):
+                out_pos += dst.write(data[written:head])
+                out_pos += dst.write(styles)
+                written = head
+                search = head + len(HEAD_END)
+                head_found = True
+            elif body != -1:
+                out_pos += dst.write(data[written:body])
+                written = body
+                search = body + len(BODY_END)
+                last_body = out_pos
+            else:
+                break
+        emit_end = max(emit_end, search)
+        out_pos += dst.write(data[written:emit_end])
+        pending = data[emit_end:]
+        if not chunk:
+            break
+
+    if last_body is not None:
+        dst.seek(last_body)
+        tail = dst.read()
+        dst.seek(last_body)
+        dst.truncate()
+        dst.write(script)
+        dst.write(tail)
+    else:
+        dst.write(script)
+    if not head_found:
+        dst.write(styles)
+    return head_found, last_body is not None
+
+
+class LazyImageReader:
+    """Read a text file as UTF-8 bytes with lazy_image_tag's attributes added to every <img>.
+
+    Whatever follows the last '>' of a chunk may be the start of a tag, so
+    it is carried over to the next one; memory stays at about one chunk plus
+    one image. read() returns whatever is ready, b'' at the end.
+    """
+
+    def __init__(self, f, base_dir='.', chunk_size=CHUNK_SIZE):
+        self._file = f
+        self._base_dir = base_dir
+        self._chunk_size = chunk_size
+        self._pending = ''
+        self._done = False
+
+    def read(self, size=-1):
+        while not self._done:
+            chunk = self._file.read(self._chunk_size)
+            if not chunk:
+                self._done = True
+                return lazy_images(self._pending, self._base_dir).encode('utf-8')
+            data = self._pending + chunk
+            cut = data.rfind('>') + 1
+            self._pending = data[cut:]
+            if cut:
+                return lazy_images(data[:cut], self._base_dir).encode('utf-8')
+        return b''
+
+
+def build_single(input_file, output_file, shared_assets=False, index=True):
+    try:
+        print(f"Streaming {input_file} to {output_file}...")
+        styles, script = page_assets(flipbook_script, 'flipbook', output_file, shared_assets)
+        if index:
+            build_index(input_file, output_file)
+            styles = index_meta(output_file) + styles
+        # One pass: images get their lazy attributes on the way into the injection
+        with open(input_file, 'r', encoding='utf-8', newline='') as source, open(output_file, 'w+b') as dst:
+            src = LazyImageReader(source, os.path.dirname(input_file))
+            head_found, body_found = inject_streaming(src, dst, styles.encode('utf-8'), script.encode('utf-8'))
+
+        if not head_found:
+            print(f"Warning: </head> not found in {input_file}, appended styles to the end")
+        if not body_found:
+            print(f"Warning: </body> not found in {input_file}, appended script to the end")
+        print(f"Done: {output_file}")
+        return True
+
+    except Exception as e:
+        print(f"Error: {input_file}: {e}")
+        return False
+
+
+def build_flipbook(input_file, output_file, pages_per_chunk=None, shared_assets=False, index=True):
+    """Build one flipbook; returns (input_file, True if it was written).
+
+    With --jobs this runs in a worker process.
+    """
+    if pages_per_chunk is None:
+        return input_file, build_single(input_file, output_file, shared_assets, index)
+    try:
+        build_paginated(input_file, output_file, pages_per_chunk, shared_assets, index)
+    except Exception as e:
+        print(f"Error: {input_file}: {e}")
+        return input_file, False
+    return input_file, True
+
+
+def flipbook_name(input_file, out_dir):
+    """illustrated-stories-part-3.html -> <out_dir>/illustrated-stories-part-3-flipbook.html"""
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(out_dir, f'{stem}{OUTPUT_SUFFIX}.html')
+
+
+def build_settings(pages_per_chunk, shared_assets, index):
+    """What besides the input decides a flipbook's bytes: the options and the build code."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    sources = [__file__] + [os.path.join(here, name) for name in BUILD_MODULES]
+    return [STATE_VERSION, pages_per_chunk, shared_assets, index] + [file_digest(path) for path in sources]
+
+
+def load_state(out_dir):
+    try:
+        with open(os.path.join(out_dir, STATE_FILE), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state.get('outputs', {}) if state.get('version') == STATE_VERSION else {}
+
+
+def companion_files(output_file):
+    """Names of the files in output_file's directory of chunks and jump index."""
+    companion_dir = os.path.splitext(output_file)[0]
+    return sorted(os.listdir(companion_dir)) if os.path.isdir(companion_dir) else []
+
+
+def outputs_exist(output_file, record):
+    """Whether the flipbook and every chunk/index file recorded for it are still there."""
+    companion_dir = os.path.splitext(output_file)[0]
+    return os.path.exists(output_file) and all(os.path.exists(os.path.join(companion_dir, name))
+                                               for name in record.get('files', ()))
+
+
+def is_up_to_date(input_file, output_file, record, settings):
+    """Check record (from the state file) against the input on disk.
+
+    A matching size and mtime is trusted as is; otherwise the input is hashed,
+    so a touched but unchanged part is still skipped. A flipbook missing its
+    page or any of its chunk/index files is never up to date. Returns (up to
+    date, the record to keep for this output).
+    """
+    stat = os.stat(input_file)
+    current = {'input': os.path.abspath(input_file), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+               'settings': settings}
+    if (not record or not outputs_exist(output_file, record) or record.get('input') != current['input']
+            or record.get('settings') != settings or record.get('size') != stat.st_size):
+        return False, current
+    if record.get('mtime_ns') == stat.st_mtime_ns:
+        return True, record
+    current['sha256'] = file_digest(input_file)
+    current['files'] = record.get('files', [])
+    return current['sha256'] == record.get('sha256'), current
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Turn the illustrated story pages into flipbooks')
+    parser.add_argument('--input', '-i', action='append', metavar='GLOB',
+                        help='story page(s) to convert; repeatable (default: %s)' % ' '.join(DEFAULT_INPUTS))
+    parser.add_argument('--out-dir', '-o', default='.',
+                        help=f'write <name>{OUTPUT_SUFFIX}.html here (default: current directory)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='build this many flipbooks in parallel (default: %(default)s)')
+    parser.add_argument('--force', action='store_true',
+                        help=f'rebuild even if a flipbook is up to date (tracked in {STATE_FILE})')
+    parser.add_argument('--pages-per-chunk', type=int,
+                        help='split stories into fixed pages at build time and write a small shell page plus '
+                             'JSON chunks of this many pages that the reader fetches on demand, instead of one '
+                             'big file')
+    parser.add_argument('--shared-assets', action='store_true',
+                        help='link the flipbook styles and script from hashed styles/*.css and js/*.js files in '
+                             '--out-dir instead of inlining them in every flipbook')
+    parser.add_argument('--no-index', dest='index', action='store_false',
+                        help='skip the jump-to-story index and its thumbnail sprites')
+    args = parser.parse_args()
+
+    if args.pages_per_chunk is not None and args.pages_per_chunk < 1:
+        parser.error('--pages-per-chunk must be at least 1')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    patterns = args.input or DEFAULT_INPUTS
+    inputs = sorted({path for pattern in patterns for path in glob.glob(pattern)
+                     if os.path.isfile(path) and not os.path.splitext(path)[0].endswith(OUTPUT_SUFFIX)})
+    if not inputs:
+        raise SystemExit(f"No input files match {' '.join(patterns)}")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    state = load_state(args.out_dir)
+    settings = build_settings(args.pages_per_chunk, args.shared_assets, args.index)
+    outputs = dict(state)  # flipbooks from inputs not given this time keep their records
+    sources = {}
+    pending = {}
+    for input_file in inputs:
+        output_file = flipbook_name(input_file, args.out_dir)
+        key = os.path.basename(output_file)
+        if key in sources:
+            parser.error(f'{input_file} and {sources[key]} would both write {output_file}')
+        sources[key] = input_file
+        fresh, outputs[key] = is_up_to_date(input_file, output_file, state.get(key), settings)
+        if fresh and not args.force:
+            print(f"{output_file} is up to date")
+        else:
+            pending[input_file] = key
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=min(args.jobs, len(pending) or 1)) as pool:
+        futures = [pool.submit(build_flipbook, input_file, flipbook_name(input_file, args.out_dir),
+                               args.pages_per_chunk, args.shared_assets, args.index)
+                   for input_file in pending]
+        for future in as_completed(futures):
+            input_file, ok = future.result()
+            record = outputs[pending[input_file]]
+            if ok:
+                record.setdefault('sha256', file_digest(input_file))
+                record['files'] = companion_files(flipbook_name(input_file, args.out_dir))
+            else:
+                failed.append(input_file)
+                del outputs[pending[input_file]]
+
+    with open(os.path.join(args.out_dir, STATE_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'version': STATE_VERSION, 'outputs': outputs}, f, indent=1)
+
+    print(f"Built {len(pending) - len(failed)} of {len(inputs)} flipbooks ({len(inputs) - len(pending)} up to date)")
+    if failed:
+        raise SystemExit(f"Failed: {', '.join(sorted(failed))}")
+
 
-except Exception as e:
-    print(f"Error: {e}")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Index the format, size and hash of the story illustrations and site images.
+
+Walks the illustrated-stories-part-*.html files (inline base64 or, after
+split-stories-correct.py --external-images, files under images/stories/)
+and every image under images/, and records each image's format, width,
+height and byte size in .image-index.json. Images are keyed by the sha256
+of their bytes, which is also the name externalized illustrations get, and
+only the header is parsed for the dimensions; nothing is decoded. A rerun
+only rescans files whose size and mtime (or failing that, hash) changed.
+
+    python3 image_index.py
+    python3 image_index.py --input 'illustrated-stories-part-1.html' --force
+
+Other scripts can read the index instead of recomputing:
+
+    index = load_index()
+    digests = index['files']['illustrated-stories-part-1.html']['images']
+    index['images'][digests[0]]  # {'format': 'jpeg', 'width': 768, ...}
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from stories import read_stories, source_files
+from story_images import file_digest, image_info, write_file
+
+INDEX_FILE = '.image-index.json'
+INDEX_VERSION = 1
+DEFAULT_INPUTS = ('illustrated-stories-part-*.html',)
+IMAGE_ROOT = 'images'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif')
+
+
+def scan_image(path):
+    """Return ([sha256], {sha256: image_info}) for an image file."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    return [digest], {digest: image_info(data)}
+
+
+def scan_part(path):
+    """Return ([sha256 or None per story], {sha256: image_info}) for a story page.
+
+    None marks a story without an illustration, or one whose image is remote
+    or missing.
+    """
+    digests = []
+    images = {}
+    for story in read_stories(path):
+        data = story.illustration
+        if data is None:
+            digests.append(None)
+            continue
+        digest = hashlib.sha256(data).hexdigest()
+        digests.append(digest)
+        if digest not in images:
+            images[digest] = image_info(data)
+    return digests, images
+
+
+def scan_file(path, record):
+    """Scan path unless record (from the index) still matches it.
+
+    A matching size and mtime is trusted as is; otherwise the file is hashed,
+    so a touched but unchanged file isn't rescanned. Returns (path, record,
+    {sha256: image_info} or None if record was reused).
+    """
+    stat = os.stat(path)
+    current = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if record and record.get('size') == stat.st_size:
+        if record.get('mtime_ns') == stat.st_mtime_ns:
+            return path, record, None
+        current['sha256'] = file_digest(path)
+        if current['sha256'] == record.get('sha256'):
+            return path, {**record, **current}, None
+    if path.lower().endswith(IMAGE_EXTENSIONS):
+        digests, images = scan_image(path)
+        current['sha256'] = digests[0]
+    else:
+        digests, images = scan_part(path)
+        current.setdefault('sha256', file_digest(path))
+    current['images'] = digests
+    return path, current, images
+
+
+def load_index(path=INDEX_FILE):
+    """Return the index at path, or an empty one if it is missing or out of date."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    if index.get('version') != INDEX_VERSION:
+        index = {'version': INDEX_VERSION, 'images': {}, 'files': {}}
+    return index
+
+
+def save_index(index, path=INDEX_FILE):
+    write_file(path, json.dumps(index, ensure_ascii=False, separators=(',', ':'), sort_keys=True))
+
+
+def image_files(root=IMAGE_ROOT):
+    """Every image under root, as /-separated paths relative to the cwd."""
+    paths = []
+    for directory, _, names in os.walk(root):
+        paths.extend(os.path.join(directory, name).replace(os.sep, '/') for name in names
+                     if name.lower().endswith(IMAGE_EXTENSIONS))
+    return paths
+
+
+def update_index(index, paths, jobs=1, force=False):
+    """Bring index up to date with paths and drop files and images no longer present.
+
+    Returns the number of files that were rescanned.
+    """
+    old_files = {} if force else index['files']
+    files = {}
+    found = {}
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for path, record, images in pool.map(scan_file, paths, [old_files.get(path) for path in paths]):
+            files[path] = record
+            if images is not None:
+                found[path] = images
+
+    # Keep the entries of reused files, add the new ones, forget the rest
+    used = {digest for record in files.values() for digest in record['images'] if digest}
+    images = {digest: info for digest, info in index['images'].items() if digest in used}
+    for scanned in found.values():
+        images.update(scanned)
+    index['files'] = files
+    index['images'] = images
+    return len(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index the size, format and hash of the story and site images')
+    parser.add_argument('--input', '-i', action='append', metavar='GLOB',
+                        help='story page(s) to index; repeatable (default: %s)' % ' '.join(DEFAULT_INPUTS))
+    parser.add_argument('--images', default=IMAGE_ROOT,
+                        help='directory of site images to index (default: %(default)s)')
+    parser.add_argument('--index', default=INDEX_FILE, help='index file to update (default: %(default)s)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='scan this many files in parallel (default: %(default)s)')
+    parser.add_argument('--force', action='store_true', help='rescan every file even if it is unchanged')
+    args = parser.parse_args()
+
+    parts = source_files(args.input or DEFAULT_INPUTS)
+    paths = parts + sorted(image_files(args.images))
+    if not paths:
+        raise SystemExit("No story pages or images found")
+
+    index = load_index(args.index)
+    scanned = update_index(index, paths, args.jobs, args.force)
+    save_index(index, args.index)
+
+    stories = sum(len(index['files'][path]['images']) for path in parts)
+    illustrated = {digest for path in parts for digest in index['files'][path]['images'] if digest}
+    total = sum(info['bytes'] for info in index['images'].values())
+    print(f"Indexed {len(paths)} files ({scanned} rescanned): {stories} stories with "
+          f"{len(illustrated)} distinct illustrations, {len(index['images'])} images "
+          f"({total / (1024 * 1024):.1f}MB) -> {args.index}")
+    unreadable = [path for path in paths[len(parts):]
+                  if index['images'][index['files'][path]['images'][0]]['format'] is None]
+    if unreadable:
+        print(f"Not a PNG, JPEG, GIF, WebP or AVIF despite the name: {', '.join(unreadable)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Write the stories to a binary pack for fast random access.
+
+Reads the part files once and writes stories.pack (see stories/pack.py):
+each story's title, theme, text and illustration bytes plus an offset
+table, so tools can mmap it and fetch story N without parsing 190MB of
+HTML.
+
+    python3 pack-stories.py
+    python3 pack-stories.py --input test-stories.html --output test.pack
+"""
+
+import argparse
+import os
+import random
+import time
+
+from stories import DEFAULT_SOURCES, Corpus, StoryPack, write_pack
+
+DEFAULT_OUTPUT = 'stories.pack'
+# Random lookups timed after writing the pack
+LOOKUPS = 10000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the stories to a memory-mappable binary pack')
+    parser.add_argument('--input', '-i', action='append', metavar='GLOB',
+                        help='story page(s) to pack, in order; repeatable (default: %s)'
+                        % ' '.join(DEFAULT_SOURCES))
+    parser.add_argument('--output', '-o', default=DEFAULT_OUTPUT, help='pack to write (default: %(default)s)')
+    args = parser.parse_args()
+
+    corpus = Corpus(*(args.input or DEFAULT_SOURCES))
+    if not corpus.files:
+        raise SystemExit("No story pages found")
+
+    start = time.perf_counter()
+    count = write_pack(corpus, args.output)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(args.output)
+    print(f"Wrote {count} stories from {len(corpus.files)} files to {args.output} "
+          f"({size / (1024 * 1024):.1f}MB) in {elapsed:.1f}s")
+
+    if count:
+        with StoryPack(args.output) as pack:
+            start = time.perf_counter()
+            for index in random.choices(range(count), k=LOOKUPS):
+                pack.text(index), pack.image(index)
+            elapsed = time.perf_counter() - start
+        print(f"Random lookup of text and image: {elapsed / LOOKUPS * 1e6:.1f}us per story")
+
+
+if __name__ == '__main__':
+    main()
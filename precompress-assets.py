@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Write .gz and .br sidecars for the site's text files.
+
+Run after split-stories-correct.py / generate-flipbook.py. story_server.py
+serves a sidecar instead of the original when the browser accepts it and
+the sidecar is at least as new as the source, so files whose sidecars are
+already newer are skipped here. Files that don't get any smaller have no
+sidecar, so .precompress-state.json remembers their size and mtime to skip
+them too.
+
+    python3 precompress-assets.py            # default globs
+    python3 precompress-assets.py 'illustrated-stories-part-*.html' --jobs 4
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from story_images import write_file
+
+try:
+    import brotli
+except ImportError:  # .br sidecars are skipped without the brotli package
+    brotli = None
+
+DEFAULT_PATTERNS = ('*.html', '*.json', '*.css', '*.js', 'styles/*.css', 'js/*.js')
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# Files that didn't get smaller, so they have no sidecar to compare against
+STATE_FILE = '.precompress-state.json'
+STATE_VERSION = 1
+
+
+def compress(data, encoding):
+    if encoding == 'gz':
+        # mtime=0 keeps the output reproducible between builds
+        return gzip.compress(data, GZIP_LEVEL, mtime=0)
+    return brotli.compress(data, quality=BROTLI_QUALITY, mode=brotli.MODE_TEXT)
+
+
+def is_fresh(path, sidecar):
+    try:
+        return os.path.getmtime(sidecar) >= os.path.getmtime(path)
+    except OSError:
+        return False
+
+
+def load_state():
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state.get('incompressible', {}) if state.get('version') == STATE_VERSION else {}
+
+
+def precompress(path, encodings, force=False, skipped=None):
+    """Write path.<encoding> for each encoding that is missing or stale.
+
+    skipped maps an encoding to the [size, mtime_ns] path had when an earlier
+    run found it didn't compress; while those still match it is skipped
+    without being read. Returns (path, original size, {encoding: sidecar size
+    or None}, {encoding: [size, mtime_ns]} for the encodings not worth
+    compressing) where None means the sidecar was already up to date.
+    """
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    skipped = skipped or {}
+    data = None
+    sizes = {}
+    incompressible = {}
+    for encoding in encodings:
+        sidecar = f'{path}.{encoding}'
+        if not force and skipped.get(encoding) == signature:
+            sizes[encoding] = None
+            incompressible[encoding] = signature
+            continue
+        if not force and is_fresh(path, sidecar):
+            sizes[encoding] = None
+            continue
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        compressed = compress(data, encoding)
+        if len(compressed) >= len(data):
+            # Not worth serving; drop any stale sidecar so it isn't used
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+            sizes[encoding] = len(data)
+            incompressible[encoding] = signature
+            continue
+        write_file(sidecar, compressed)
+        sizes[encoding] = len(compressed)
+    return path, stat.st_size, sizes, incompressible
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write precompressed .gz/.br sidecars for HTML, CSS, JS and JSON')
+    parser.add_argument('patterns', nargs='*', default=DEFAULT_PATTERNS,
+                        help='glob patterns of files to compress (default: %(default)s)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='compress this many files in parallel (default: %(default)s)')
+    parser.add_argument('--force', action='store_true', help='recompress even if sidecars are up to date')
+    args = parser.parse_args()
+
+    encodings = ['gz']
+    if brotli is not None:
+        encodings.append('br')
+    else:
+        print("brotli not installed (pip install brotli); writing .gz only")
+
+    paths = sorted({path for pattern in args.patterns for path in glob.glob(pattern) if os.path.isfile(path)})
+    if not paths:
+        raise SystemExit("No files matched")
+
+    skipped = load_state()
+    totals = {encoding: [0, 0] for encoding in encodings}
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        results = pool.map(precompress, paths, [encodings] * len(paths), [args.force] * len(paths),
+                           [skipped.get(path) for path in paths])
+        for path, size, sizes, incompressible in results:
+            if incompressible:
+                skipped[path] = incompressible
+            else:
+                skipped.pop(path, None)
+            columns = []
+            for encoding in encodings:
+                compressed = sizes[encoding]
+                if compressed is None:
+                    columns.append(f"{encoding} up to date")
+                    continue
+                totals[encoding][0] += size
+                totals[encoding][1] += compressed
+                columns.append(f"{encoding} {compressed / (1024 * 1024):.2f}MB ({compressed / size:.0%})"
+                               if size else f"{encoding} empty")
+            print(f"{path}: {size / (1024 * 1024):.2f}MB -> {', '.join(columns)}")
+
+    skipped = {path: entry for path, entry in skipped.items() if os.path.isfile(path)}
+    write_file(STATE_FILE, json.dumps({'version': STATE_VERSION, 'incompressible': skipped}, indent=1))
+
+    for encoding, (size, compressed) in totals.items():
+        if size:
+            print(f"Total .{encoding}: {size / (1024 * 1024):.1f}MB -> {compressed / (1024 * 1024):.1f}MB "
+                  f"({compressed / size:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,4 +7,4 @@ echo "👉 http://localhost:8000/story-image-injector.html"
 echo ""
 echo "Press Ctrl+C to stop the server"
 echo ""
-python3 -m http.server 8000
+python3 "$(dirname "$0")/story_server.py" 8000
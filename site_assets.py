@@ -0,0 +1,54 @@
+"""Shared, hashed CSS/JS files for the generated story pages.
+
+Every part file repeats the same <style> header and every flipbook inlines
+the same styles and script. Written once as styles/<name>.<hash>.css and
+js/<name>.<hash>.js instead, the browser downloads them once for the whole
+site. The name changes whenever the contents do, so story_server.py can
+serve them with a year-long immutable Cache-Control.
+"""
+
+import hashlib
+import os
+import re
+
+from story_images import write_file
+
+ASSET_DIRS = {'css': 'styles', 'js': 'js'}
+# Hex digits of the sha256 kept in the file name (story_server.IMMUTABLE)
+HASH_LENGTH = 16
+
+_BLOCK = re.compile(r'<(style|script)\b([^>]*)>(.*?)</\1\s*>', re.DOTALL | re.IGNORECASE)
+_SRC_ATTR = re.compile(r'\ssrc\s*=', re.IGNORECASE)
+_TYPE_ATTR = re.compile(r'\stype\s*=\s*["\']?([^"\'\s>]+)', re.IGNORECASE)
+_SCRIPT_TYPES = {'text/javascript', 'application/javascript', 'module'}
+
+
+def write_asset(text, name, extension, root='.'):
+    """Write text to root/<dir>/<name>.<hash>.<extension> once and return its URL relative to root."""
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:HASH_LENGTH]
+    url = f'{ASSET_DIRS[extension]}/{name}.{digest}.{extension}'
+    path = os.path.join(root, url)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file(path, text)
+    return url
+
+
+def _shared(match, name, root):
+    tag, attrs, body = match.groups()
+    if tag.lower() == 'style':
+        return f'<link rel="stylesheet" href="{write_asset(body, name, "css", root)}"{attrs}>'
+    script_type = _TYPE_ATTR.search(attrs)
+    if _SRC_ATTR.search(attrs) or (script_type and script_type.group(1).lower() not in _SCRIPT_TYPES):
+        # Already external, or data such as JSON that has to stay inline
+        return match.group(0)
+    return f'<script src="{write_asset(body, name, "js", root)}"{attrs}></script>'
+
+
+def share_inline(html, name, root='.'):
+    """Swap each inline <style> and <script> in html for a link to a shared file.
+
+    Attributes such as id are kept on the new tag. URLs are relative to root,
+    which should be the directory the page is served from.
+    """
+    return _BLOCK.sub(lambda match: _shared(match, name, root), html)
@@ -1,43 +1,35 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
 import re
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 
-# Read the original file
-with open('illustrated-stories-5.html', 'r', encoding='utf-8') as f:
-    content = f.read()
+from story_images import (DATA_URI, RESPONSIVE_FORMATS, STORY_IMAGE_DIR, externalize_images,
+                          image_src, lazy_images, responsive_images, supported_formats)
+from site_assets import share_inline
+from story_partition import balanced_parts, count_parts, parse_size
+from story_tokenizer import StoryTokenizer, normalize_theme, story_theme, story_title, theme_slug
 
-# Pattern: story div followed by its illustration div
-# <div class="story">...</div></div><div class="story-illustration">...</div>
-pattern = r'<div class="story">.*?</div>\s*</div>\s*<div class="story-illustration".*?</div>'
-story_blocks = re.findall(pattern, content, re.DOTALL)
-
-print(f"Found {len(story_blocks)} complete story+image blocks")
-
-# Split into 10 files (100 stories per file)
-stories_per_file = 100
-
-# Extract header (everything before first story)
-header_match = re.search(r'(.*?)<div class="story">', content, re.DOTALL)
-header = header_match.group(1) if header_match else ''
+SOURCE_FILE = 'illustrated-stories-5.html'
+MANIFEST_FILE = 'stories-manifest.json'
+# Theme -> story ids, and the optional one-file-per-theme bundles
+THEMES_FILE = 'stories-themes.json'
+THEME_BUNDLE = 'illustrated-stories-theme-{slug}.html'
+THEME_BUNDLE_NAME = re.compile(r'illustrated-stories-theme-[a-z0-9-]+\.html')
+PART_FILE = 'illustrated-stories-part-{number}.html'
+PART_NAME = re.compile(r'illustrated-stories-part-(\d+)\.html')
+# What the last run wrote, so --incremental can skip unchanged parts
+STATE_FILE = '.split-stories-state.json'
+STATE_VERSION = 3
+STORIES_PER_PART = 100
 
 # Footer
-footer = '\n</body>\n</html>'
-
-# Create 10 part files
-for i in range(10):
-    start_idx = i * stories_per_file
-    end_idx = min((i + 1) * stories_per_file, len(story_blocks))
-    part_stories = story_blocks[start_idx:end_idx]
-    
-    part_content = header + '\n'.join(part_stories) + footer
-    
-    filename = f'illustrated-stories-part-{i+1}.html'
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(part_content)
-    
-    file_size = len(part_content) / (1024 * 1024)
-    print(f"Created {filename} with {len(part_stories)} stories ({file_size:.1f}MB)")
+FOOTER = '\n</body>\n</html>'
 
-# Create loader HTML
-loader_html = '''<!DOCTYPE html>
+LOADER_HTML = '''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -53,8 +45,9 @@ loader_html = '''<!DOCTYPE html>
             const contentDiv = document.getElementById('content');
             const loadingDiv = document.getElementById('loading');
             
-            for (let i = 1; i <= 10; i++) {
-                const response = await fetch(`illustrated-stories-part-${i}.html`);
+            const parts = %(parts)s;
+            for (let i = 0; i < parts.length; i++) {
+                const response = await fetch(parts[i]);
                 const html = await response.text();
                 
                 const parser = new DOMParser();
@@ -63,7 +56,7 @@ loader_html = '''<!DOCTYPE html>
                 
                 stories.forEach(story => contentDiv.appendChild(story.cloneNode(true)));
                 
-                loadingDiv.textContent = `Loaded ${i * 10}% of stories...`;
+                loadingDiv.textContent = `Loaded ${Math.round((i + 1) * 100 / parts.length)}%% of stories...`;
             }
             
             loadingDiv.remove();
@@ -74,7 +67,328 @@ loader_html = '''<!DOCTYPE html>
 </body>
 </html>'''
 
-with open('illustrated-stories-loader.html', 'w', encoding='utf-8') as f:
-    f.write(loader_html)
 
-print("\nCreated illustrated-stories-loader.html")
+def write_part(filename, header, stories, image_mode=None, image_formats=RESPONSIVE_FORMATS):
+    """Write one part file from its (story, illustration) pairs.
+
+    With --jobs this runs in a worker process, so it only touches its own
+    part file and the content-addressed images. Returns the filename, one
+    manifest entry per story (byte ranges are relative to the part file),
+    the part's size in bytes and a Counter of image bytes for the report.
+    """
+    image_sizes = Counter()
+    entries = []
+    with open(filename, 'wb') as f:
+        offset = f.write(header.encode('utf-8'))
+        for i, (story, illustration) in enumerate(stories):
+            if image_mode == 'responsive':
+                illustration, sizes = responsive_images(illustration, formats=image_formats)
+                image_sizes.update(sizes)
+            elif image_mode == 'external':
+                illustration = externalize_images(illustration)
+            else:
+                illustration = lazy_images(illustration)
+            if i:
+                offset += f.write(b'\n')
+            story_bytes = story.encode('utf-8')
+            block = story_bytes + illustration.encode('utf-8')
+            entries.append({
+                'title': story_title(story),
+                'theme': story_theme(story),
+                'offset': offset,
+                'length': len(block),
+                'story_length': len(story_bytes),
+                'image': image_src(illustration),
+            })
+            offset += f.write(block)
+        offset += f.write(FOOTER.encode('utf-8'))
+    return filename, entries, offset, image_sizes
+
+
+def block_size(story, illustration, image_mode=None):
+    """Bytes a story block adds to its part file."""
+    if image_mode:
+        # Externalized images leave only a short src behind
+        illustration = DATA_URI.sub('', illustration)
+    return len(story.encode('utf-8')) + len(illustration.encode('utf-8'))
+
+
+def measure_blocks(image_mode=None):
+    """Tokenize SOURCE_FILE once and return the byte size and sha256 of every story block."""
+    sizes = []
+    digests = []
+    with open(SOURCE_FILE, 'r', encoding='utf-8') as source:
+        for story, illustration in StoryTokenizer(source):
+            sizes.append(block_size(story, illustration, image_mode))
+            digests.append(hashlib.sha256((story + illustration).encode('utf-8')).hexdigest())
+    return sizes, digests
+
+
+def part_key(header, digests, image_mode, image_formats):
+    """Hash everything a part file's content depends on."""
+    inputs = [STATE_VERSION, header, FOOTER, image_mode, image_formats, digests]
+    return hashlib.sha256(json.dumps(inputs).encode('utf-8')).hexdigest()
+
+
+def load_state():
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get('version') == STATE_VERSION else None
+
+
+def reuse_part(filename, entries, length):
+    """Stand-in for write_part when a part's inputs haven't changed."""
+    return filename, entries, length, None
+
+
+def iter_parts(tokens, part_lengths):
+    """Group tokenized (story, illustration) pairs into runs of part_lengths."""
+    lengths = iter(part_lengths)
+    wanted = next(lengths, 0)
+    part = []
+    for pair in tokens:
+        part.append(pair)
+        if len(part) == wanted:
+            yield part
+            part = []
+            wanted = next(lengths, 0)
+
+
+def run_in_pool(jobs, calls):
+    """Yield fn(*args) for each (fn, args) in calls, in order, using jobs processes.
+
+    At most 2 * jobs parts are in flight so memory stays bounded by a few
+    parts rather than growing with the corpus.
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        for fn, args in calls:
+            pending.append(pool.submit(fn, *args))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def report_part(filename, stories, length, image_sizes, image_formats):
+    file_size = length / (1024 * 1024)
+    if image_sizes is None:
+        print(f"Kept {filename} with {stories} stories ({file_size:.1f}MB, unchanged)")
+        return
+    print(f"Created {filename} with {stories} stories ({file_size:.1f}MB)")
+    if image_sizes['inline']:
+        # What a browser downloads for the full-width images in each format,
+        # against the original images' bytes (not their base64)
+        best = image_sizes[image_formats[0]]
+        formats = ', '.join(f"{fmt} {image_sizes[fmt] / (1024 * 1024):.1f}MB" for fmt in image_formats)
+        print(f"    images: {image_sizes['inline'] / (1024 * 1024):.1f}MB original -> {formats} "
+              f"(saved {(image_sizes['inline'] - best) / (1024 * 1024):.1f}MB)")
+
+
+def theme_facets(manifest_stories):
+    """Group the manifest's stories by normalized theme.
+
+    Returns [{'theme', 'slug', 'stories': [ids]}] sorted by theme; stories
+    without a theme are left out.
+    """
+    groups = {}
+    for story in manifest_stories:
+        theme = normalize_theme(story['theme'])
+        if theme:
+            groups.setdefault(theme, []).append(story['id'])
+    facets = []
+    slugs = set()
+    for theme in sorted(groups):
+        slug = base = theme_slug(theme)
+        suffix = 2
+        while slug in slugs:
+            slug = f'{base}-{suffix}'
+            suffix += 1
+        slugs.add(slug)
+        facets.append({'theme': theme, 'slug': slug, 'stories': groups[theme]})
+    return facets
+
+
+def write_theme_bundle(filename, header, stories):
+    """Write filename with header and the given manifest stories' blocks, copied from their parts.
+
+    The blocks already went through the image handling when the parts were
+    written, so they are copied byte for byte.
+    """
+    parts = {}
+    try:
+        with open(filename, 'wb') as f:
+            f.write(header.encode('utf-8'))
+            for i, story in enumerate(stories):
+                part = parts.get(story['part'])
+                if part is None:
+                    part = parts[story['part']] = open(story['part'], 'rb')
+                part.seek(story['offset'])
+                if i:
+                    f.write(b'\n')
+                f.write(part.read(story['length']))
+            f.write(FOOTER.encode('utf-8'))
+    finally:
+        for part in parts.values():
+            part.close()
+    return os.path.getsize(filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f'Split {SOURCE_FILE} into part files')
+    parser.add_argument('--external-images', action='store_true',
+                        help=f'write illustrations to {STORY_IMAGE_DIR}/<sha256>.<ext>, with the extension taken '
+                             'from the image format, instead of inlining base64')
+    parser.add_argument('--responsive-images', action='store_true',
+                        help='also re-encode illustrations at several widths and emit <picture>/srcset markup '
+                             '(needs Pillow)')
+    parser.add_argument('--image-formats', default=','.join(RESPONSIVE_FORMATS),
+                        help='comma-separated formats for --responsive-images, best first (e.g. avif,webp)')
+    parser.add_argument('--stories-per-part', type=int, default=STORIES_PER_PART,
+                        help='aim for this many stories per part; parts are balanced by size (default: %(default)s)')
+    parser.add_argument('--part-size', type=parse_size,
+                        help='aim for parts of this size instead, e.g. 16M (overrides --stories-per-part)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='write (and transcode) this many parts in parallel worker processes')
+    parser.add_argument('--shared-assets', action='store_true',
+                        help="move the header's inline <style> into a hashed styles/stories.<hash>.css that "
+                             'every part links to')
+    parser.add_argument('--theme-bundles', action='store_true',
+                        help=f"also write each theme's stories to {THEME_BUNDLE.format(slug='<theme>')}")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f'only rewrite parts whose stories changed since the last run (tracked in {STATE_FILE})')
+    args = parser.parse_args()
+
+    image_formats = args.image_formats.split(',')
+    if args.responsive_images:
+        missing = set(image_formats) - set(supported_formats(image_formats))
+        if missing:
+            parser.error(f"--responsive-images can't encode {', '.join(sorted(missing))}; install or upgrade Pillow")
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.stories_per_part < 1:
+        parser.error('--stories-per-part must be at least 1')
+
+    image_mode = None
+    if args.responsive_images:
+        image_mode = 'responsive'
+    elif args.external_images:
+        image_mode = 'external'
+
+    # Measure every block first so parts can be balanced by size
+    sizes, digests = measure_blocks(image_mode)
+    options = {'stories': len(sizes), 'stories_per_part': args.stories_per_part,
+               'part_size': args.part_size, 'image_mode': image_mode}
+
+    state = load_state() if args.incremental else None
+    previous_parts = {}
+    if state and state['options'] == options:
+        # Keep the old boundaries so an edited story doesn't ripple into its neighbours
+        part_lengths = state['part_lengths']
+        previous_parts = {part['file']: part for part in state['parts']}
+    else:
+        part_lengths = balanced_parts(sizes, count_parts(sizes, args.part_size, args.stories_per_part))
+
+    parts = []
+    state_parts = []
+    manifest_stories = []
+    with open(SOURCE_FILE, 'r', encoding='utf-8') as source:
+        tokens = StoryTokenizer(source)
+
+        # Extract header (everything before first story)
+        header = tokens.header
+        if args.shared_assets:
+            header = share_inline(header, 'stories')
+
+        keys = []
+        start = 0
+        for part_length in part_lengths:
+            keys.append(part_key(header, digests[start:start + part_length], image_mode, image_formats))
+            start += part_length
+
+        def part_calls():
+            """Hand each part to a writer as soon as its stories arrive."""
+            for i, stories in enumerate(iter_parts(tokens, part_lengths), 1):
+                filename = PART_FILE.format(number=i)
+                previous = previous_parts.get(filename)
+                if (previous and previous['key'] == keys[i - 1]
+                        and os.path.exists(filename) and os.path.getsize(filename) == previous['bytes']):
+                    yield reuse_part, (filename, previous['entries'], previous['bytes'])
+                else:
+                    yield write_part, (filename, header, stories, image_mode, image_formats)
+
+        if args.jobs > 1:
+            results = run_in_pool(args.jobs, part_calls())
+        else:
+            results = (fn(*call_args) for fn, call_args in part_calls())
+
+        for key, (filename, entries, length, image_sizes) in zip(keys, results):
+            report_part(filename, len(entries), length, image_sizes, image_formats)
+            parts.append({'file': filename, 'stories': len(entries), 'bytes': length})
+            state_parts.append({'file': filename, 'key': key, 'bytes': length, 'entries': entries})
+            for entry in entries:
+                manifest_stories.append({'id': len(manifest_stories) + 1, 'part': filename, **entry})
+
+    # Parts left over from a run that produced more of them, which the
+    # loader and anything globbing the parts would otherwise pick up
+    for filename in sorted(glob.glob(PART_FILE.format(number='*'))):
+        match = PART_NAME.fullmatch(filename)
+        if match and int(match.group(1)) > len(parts):
+            os.remove(filename)
+            print(f"Removed {filename}")
+
+    print(f"Found {len(manifest_stories)} stories")
+
+    # Lets clients build a table of contents and Range-fetch single stories
+    with open(MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'parts': parts, 'stories': manifest_stories}, f, ensure_ascii=False, separators=(',', ':'))
+        f.write('\n')
+
+    print(f"Created {MANIFEST_FILE}")
+
+    # Lets a reader browse one theme without loading every part
+    facets = theme_facets(manifest_stories)
+    state_bundles = {}
+    if args.theme_bundles:
+        previous_bundles = state.get('bundles', {}) if state else {}
+        for facet in facets:
+            filename = facet['bundle'] = THEME_BUNDLE.format(slug=facet['slug'])
+            # Like a part, a bundle only changes with its stories or the page setup
+            key = part_key(header, [digests[story_id - 1] for story_id in facet['stories']], image_mode,
+                           image_formats)
+            previous = previous_bundles.get(filename)
+            if (previous and previous['key'] == key
+                    and os.path.exists(filename) and os.path.getsize(filename) == previous['bytes']):
+                size = previous['bytes']
+                print(f"Kept {filename} with {len(facet['stories'])} stories "
+                      f"({size / (1024 * 1024):.2f}MB, unchanged)")
+            else:
+                size = write_theme_bundle(filename, header,
+                                          [manifest_stories[story_id - 1] for story_id in facet['stories']])
+                print(f"{filename}: {len(facet['stories'])} stories, {size / (1024 * 1024):.2f}MB")
+            state_bundles[filename] = {'key': key, 'bytes': size}
+        for filename in sorted(glob.glob(THEME_BUNDLE.format(slug='*'))):
+            if THEME_BUNDLE_NAME.fullmatch(filename) and filename not in state_bundles:
+                os.remove(filename)
+                print(f"Removed {filename}")
+    with open(THEMES_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'themes': facets}, f, ensure_ascii=False, separators=(',', ':'))
+        f.write('\n')
+
+    print(f"Created {THEMES_FILE} ({len(facets)} themes)")
+
+    with open(STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'version': STATE_VERSION, 'options': options, 'part_lengths': part_lengths,
+                   'parts': state_parts, 'bundles': state_bundles}, f, ensure_ascii=False, separators=(',', ':'))
+
+    with open('illustrated-stories-loader.html', 'w', encoding='utf-8') as f:
+        f.write(LOADER_HTML % {'parts': json.dumps([part['file'] for part in parts])})
+
+    print("\nCreated illustrated-stories-loader.html")
+
+
+if __name__ == '__main__':
+    main()
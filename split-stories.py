@@ -1,35 +1,32 @@
 #!/usr/bin/env python3
 """Split illustrated-stories-5.html into smaller parts for GitHub"""
 
-import re
 import os
 
-# Read the full file
+from story_partition import balanced_parts
+from story_tokenizer import StoryTokenizer
+
+# Tokenize the full file into (story, illustration) pairs
 with open('illustrated-stories-5.html', 'r', encoding='utf-8') as f:
-    content = f.read()
+    tokens = StoryTokenizer(f)
 
-# Find all story divs (including the wrapper div with image)
-stories = re.findall(r'<div>\s*<img[^>]*>.*?<div class="story">.*?</div>\s*</div>', content, re.DOTALL)
-print(f"Found {len(stories)} stories")
+    # Extract header (everything before first story)
+    header = tokens.header
 
-# Extract header (everything before first story)
-header_match = re.search(r'^(.*?)<div class="story">', content, re.DOTALL)
-header = header_match.group(1) if header_match else ''
+    # Wrap each pair in a div so the loader can clone story.parentElement
+    stories = [f'<div>\n{illustration}\n{story}\n</div>' for story, illustration in tokens]
+print(f"Found {len(stories)} stories")
 
 # Extract footer (everything after last story)
 footer = '</body></html>'
 
-# Split into 10 parts
-stories_per_part = len(stories) // 10 + 1
-parts = []
+# Split into 10 parts of roughly equal size
+part_lengths = balanced_parts([len(story.encode('utf-8')) for story in stories], 10)
+start_idx = 0
 
-for i in range(10):
-    start_idx = i * stories_per_part
-    end_idx = min((i + 1) * stories_per_part, len(stories))
-    part_stories = stories[start_idx:end_idx]
-    
-    if not part_stories:
-        break
+for i, part_length in enumerate(part_lengths):
+    part_stories = stories[start_idx:start_idx + part_length]
+    start_idx += part_length
     
     # Create part file
     part_content = header + '\n'.join(part_stories) + '\n' + footer
@@ -0,0 +1,33 @@
+"""Read the illustrated stories as Story records.
+
+    from stories import Corpus
+
+    for story in Corpus():  # illustrated-stories-part-*.html
+        print(story.number, story.title, story.theme, len(story.text))
+
+    for story in Corpus('test-stories.html'):
+        data = story.illustration  # image bytes, or None
+
+Stories are read one at a time through story_tokenizer.StoryTokenizer, so
+memory stays at about one story however large the corpus is. For repeated
+random access, write them once to a pack (see stories.pack):
+
+    write_pack(Corpus(), 'stories.pack')
+    with StoryPack('stories.pack') as pack:
+        pack.title(41), pack.text(41), pack.image(41)
+
+and for lookups by number, part, title or theme and full-text search, load
+them into a SQLite catalog (see stories.catalog):
+
+    with Catalog('stories.db') as catalog:
+        catalog.refresh(source_files())
+        catalog.story(734)['part'], catalog.search('golden egg')
+"""
+
+from .catalog import Catalog
+from .corpus import DEFAULT_SOURCES, Corpus, read_stories, source_files
+from .pack import StoryPack, write_pack
+from .record import Story
+
+__all__ = ['Catalog', 'Corpus', 'DEFAULT_SOURCES', 'Story', 'StoryPack', 'read_stories', 'source_files',
+           'write_pack']
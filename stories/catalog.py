@@ -0,0 +1,239 @@
+"""A SQLite catalog of the stories for indexed lookups and full-text search.
+
+Tables:
+
+    parts        each source page with its size, mtime, sha256 and story count
+    stories      number (from 1 across the corpus), part, position in the
+                 part, title, theme, plain text and illustration hash
+    themes       the distinct Theme: lines
+    images       each illustration's format, size and byte count by sha256
+    stories_fts  FTS5 index of the titles and text (if SQLite has FTS5)
+
+refresh() loads each page in its own transaction and skips pages whose
+size and mtime (or failing that, hash) haven't changed since the last run,
+so only edited parts are reparsed.
+
+    with Catalog('stories.db') as catalog:
+        catalog.refresh(source_files())
+        catalog.story(734)['part']
+        catalog.by_theme('friendly dragons and castles')
+        catalog.search('golden egg')
+"""
+
+import hashlib
+import os
+import sqlite3
+
+from story_images import file_digest, image_info
+
+from .corpus import read_stories
+
+CATALOG_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE parts (
+    path TEXT PRIMARY KEY,
+    ordinal INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    story_count INTEGER NOT NULL
+);
+CREATE TABLE themes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE
+);
+CREATE TABLE images (
+    sha256 TEXT PRIMARY KEY,
+    format TEXT,
+    width INTEGER,
+    height INTEGER,
+    bytes INTEGER NOT NULL
+);
+CREATE TABLE stories (
+    id INTEGER PRIMARY KEY,
+    number INTEGER NOT NULL,
+    part TEXT NOT NULL REFERENCES parts(path),
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    theme_id INTEGER REFERENCES themes(id),
+    text TEXT NOT NULL,
+    image TEXT REFERENCES images(sha256)
+);
+CREATE INDEX stories_number ON stories(number);
+CREATE INDEX stories_part ON stories(part, position);
+CREATE INDEX stories_theme ON stories(theme_id);
+CREATE INDEX stories_title ON stories(title COLLATE NOCASE);
+CREATE INDEX stories_image ON stories(image);
+"""
+FTS_SCHEMA = "CREATE VIRTUAL TABLE stories_fts USING fts5(title, text)"
+TABLES = ('stories_fts', 'stories', 'images', 'themes', 'parts')
+
+STORY_COLUMNS = """
+    SELECT stories.number, stories.part, stories.position, stories.title, themes.name AS theme,
+           stories.text, stories.image
+    FROM stories LEFT JOIN themes ON themes.id = stories.theme_id
+"""
+
+
+def fts_query(query):
+    """Quote each word of query as an FTS5 string, so punctuation is searched for, not parsed.
+
+    "Peep's hat" becomes '"Peep's" "hat"', which matches stories with both.
+    """
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+class Catalog:
+    """The story catalog in the SQLite database at path (created if missing).
+
+    Query methods return sqlite3.Row objects, which index like dicts.
+    has_search is False when this SQLite was built without FTS5.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        # Readers (e.g. a server) aren't blocked while a refresh writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != CATALOG_VERSION:
+            self._create()
+        self.has_search = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'stories_fts'").fetchone() is not None
+
+    def _create(self):
+        with self.connection:
+            for table in TABLES:
+                self.connection.execute(f'DROP TABLE IF EXISTS {table}')
+            self.connection.executescript(SCHEMA)
+            try:
+                self.connection.execute(FTS_SCHEMA)
+            except sqlite3.OperationalError:  # no FTS5; search() is unavailable
+                pass
+            self.connection.execute(f'PRAGMA user_version = {CATALOG_VERSION}')
+
+    def refresh(self, paths):
+        """Bring the catalog up to date with the story pages in paths, in order.
+
+        Pages not in paths are dropped. Returns the list of pages that were
+        (re)loaded.
+        """
+        known = {row['path']: row for row in self.connection.execute('SELECT * FROM parts')}
+        loaded = []
+        for ordinal, path in enumerate(paths):
+            stat = os.stat(path)
+            record = known.pop(path, None)
+            digest = None
+            if record is not None and record['size'] == stat.st_size:
+                if record['mtime_ns'] != stat.st_mtime_ns:
+                    digest = file_digest(path)
+                if digest is None or digest == record['sha256']:
+                    with self.connection:
+                        self.connection.execute('UPDATE parts SET ordinal = ?, mtime_ns = ? WHERE path = ?',
+                                                (ordinal, stat.st_mtime_ns, path))
+                    continue
+            with self.connection:
+                self._remove_part(path)
+                self._load_part(path, ordinal, stat, digest or file_digest(path))
+            loaded.append(path)
+
+        with self.connection:
+            for path in known:
+                self._remove_part(path)
+            self._renumber()
+            self.connection.execute('DELETE FROM themes WHERE id NOT IN (SELECT theme_id FROM stories '
+                                    'WHERE theme_id IS NOT NULL)')
+            self.connection.execute('DELETE FROM images WHERE sha256 NOT IN (SELECT image FROM stories '
+                                    'WHERE image IS NOT NULL)')
+        return loaded
+
+    def _remove_part(self, path):
+        if self.has_search:
+            self.connection.execute('DELETE FROM stories_fts WHERE rowid IN '
+                                    '(SELECT id FROM stories WHERE part = ?)', (path,))
+        self.connection.execute('DELETE FROM stories WHERE part = ?', (path,))
+        self.connection.execute('DELETE FROM parts WHERE path = ?', (path,))
+
+    def _theme_id(self, name):
+        if not name:
+            return None
+        self.connection.execute('INSERT OR IGNORE INTO themes (name) VALUES (?)', (name,))
+        return self.connection.execute('SELECT id FROM themes WHERE name = ?', (name,)).fetchone()[0]
+
+    def _load_part(self, path, ordinal, stat, digest):
+        rows = []
+        for position, story in enumerate(read_stories(path)):
+            image = None
+            data = story.illustration
+            if data is not None:
+                image = hashlib.sha256(data).hexdigest()
+                info = image_info(data)
+                self.connection.execute(
+                    'INSERT OR IGNORE INTO images (sha256, format, width, height, bytes) VALUES (?, ?, ?, ?, ?)',
+                    (image, info['format'], info['width'], info['height'], info['bytes']))
+            # Numbers are filled in by _renumber once every part is loaded
+            rows.append((0, path, position, story.title, self._theme_id(story.theme), story.text, image))
+        self.connection.executemany(
+            'INSERT INTO stories (number, part, position, title, theme_id, text, image) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        if self.has_search:
+            self.connection.execute('INSERT INTO stories_fts (rowid, title, text) '
+                                    'SELECT id, title, text FROM stories WHERE part = ?', (path,))
+        self.connection.execute(
+            'INSERT INTO parts (path, ordinal, size, mtime_ns, sha256, story_count) VALUES (?, ?, ?, ?, ?, ?)',
+            (path, ordinal, stat.st_size, stat.st_mtime_ns, digest, len(rows)))
+
+    def _renumber(self):
+        first = 1
+        for row in self.connection.execute('SELECT path, story_count FROM parts ORDER BY ordinal').fetchall():
+            self.connection.execute('UPDATE stories SET number = position + ? '
+                                    'WHERE part = ? AND number != position + ?', (first, row['path'], first))
+            first += row['story_count']
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM stories').fetchone()[0]
+
+    def story(self, number):
+        """The story numbered number (title, theme, part, text, ...), or None."""
+        return self.connection.execute(STORY_COLUMNS + ' WHERE stories.number = ?', (number,)).fetchone()
+
+    def by_theme(self, theme):
+        """The stories whose theme is theme (case-insensitive), in order."""
+        return self.connection.execute(STORY_COLUMNS + ' WHERE themes.name = ? ORDER BY stories.number',
+                                       (theme,)).fetchall()
+
+    def by_title(self, title):
+        """The stories titled title (case-insensitive), in order."""
+        return self.connection.execute(STORY_COLUMNS + ' WHERE stories.title = ? COLLATE NOCASE '
+                                       'ORDER BY stories.number', (title,)).fetchall()
+
+    def themes(self):
+        """(name, story count) rows, most common first."""
+        return self.connection.execute(
+            'SELECT themes.name, COUNT(*) AS stories FROM stories JOIN themes ON themes.id = stories.theme_id '
+            'GROUP BY themes.id ORDER BY stories DESC, themes.name').fetchall()
+
+    def search(self, query, limit=20):
+        """Best FTS5 matches for the words in query as (number, title, part, snippet) rows.
+
+        Every word must occur; quotes and other punctuation are taken
+        literally (see fts_query).
+        """
+        if not self.has_search:
+            raise RuntimeError('this SQLite build has no FTS5, so the catalog has no search index')
+        match = fts_query(query)
+        if not match:
+            return []
+        return self.connection.execute(
+            "SELECT stories.number, stories.title, stories.part, snippet(stories_fts, 1, '[', ']', '...', 12) "
+            'AS snippet FROM stories_fts JOIN stories ON stories.id = stories_fts.rowid '
+            'WHERE stories_fts MATCH ? ORDER BY rank LIMIT ?', (match, limit)).fetchall()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,67 @@
+"""Lazy iteration over the stories in one or more story pages."""
+
+import glob
+import os
+import re
+
+from story_tokenizer import CHUNK_SIZE, StoryTokenizer
+
+from .record import Story
+
+DEFAULT_SOURCES = ('illustrated-stories-part-*.html',)
+
+
+def _part_number(path):
+    match = re.search(r'(\d+)\.html$', path)
+    return int(match.group(1)) if match else 0
+
+
+def source_files(patterns=DEFAULT_SOURCES):
+    """The story pages matching patterns, in order.
+
+    Each pattern's matches are sorted by part number; the *-flipbook.html
+    files generate-flipbook.py writes next to the parts are skipped. A
+    pattern may also be a plain path.
+    """
+    files = []
+    for pattern in patterns:
+        matches = sorted((path for path in glob.glob(pattern)
+                          if os.path.isfile(path) and not path.endswith('-flipbook.html')),
+                         key=lambda path: (_part_number(path), path))
+        files.extend(path for path in matches if path not in files)
+    return files
+
+
+def read_stories(path, first_number=1, chunk_size=CHUNK_SIZE):
+    """Yield a Story for each story in the page at path, numbered from first_number."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, (story, illustration) in enumerate(StoryTokenizer(f, chunk_size), first_number):
+            yield Story.from_html(path, number, story, illustration)
+
+
+class Corpus:
+    """The stories of one or more pages, read lazily in order.
+
+    Corpus() reads illustrated-stories-part-*.html; pass glob patterns or
+    paths such as 'test-output.html' for other pages. Each iteration rereads
+    the files, and only the story being yielded is held in memory. Stories
+    are numbered from 1 across all the files.
+    """
+
+    def __init__(self, *patterns, chunk_size=CHUNK_SIZE):
+        self.patterns = patterns or DEFAULT_SOURCES
+        self.chunk_size = chunk_size
+
+    @property
+    def files(self):
+        return source_files(self.patterns)
+
+    def __iter__(self):
+        number = 1
+        for path in self.files:
+            for story in read_stories(path, number, self.chunk_size):
+                yield story
+                number = story.number + 1
+
+    def __repr__(self):
+        return f'Corpus({", ".join(map(repr, self.patterns))})'
@@ -0,0 +1,107 @@
+"""A binary pack of the stories for random access without parsing HTML.
+
+Layout, little-endian:
+
+    header    magic b'STORYPAK', version u32, story count u32, table offset u64
+    blobs     each story's title, theme, text (UTF-8) and illustration bytes
+    table     per story and field, a u64 offset and u32 length into the file
+
+The table goes last so the pack can be written in one pass over a lazy
+Corpus. StoryPack mmaps the file and hands out memoryview slices of it, so
+looking up story n costs one table read and copies nothing.
+
+    with StoryPack('stories.pack') as pack:
+        text = str(pack.text(41), 'utf-8')
+        image = pack.image(41)  # memoryview of the JPEG/PNG bytes, or None
+"""
+
+import mmap
+import struct
+
+from story_images import atomic_open
+
+MAGIC = b'STORYPAK'
+PACK_VERSION = 1
+FIELDS = ('title', 'theme', 'text', 'image')
+
+HEADER = struct.Struct('<8sIIQ')
+ENTRY = struct.Struct('<' + 'QI' * len(FIELDS))
+
+
+def write_pack(stories, path):
+    """Write the Story records in stories to a pack at path; return how many were written."""
+    table = []
+    with atomic_open(path) as f:
+        f.write(HEADER.pack(MAGIC, PACK_VERSION, 0, 0))
+        for story in stories:
+            entry = []
+            for field in (story.title.encode('utf-8'), story.theme.encode('utf-8'), story.text.encode('utf-8'),
+                          story.illustration or b''):
+                entry.extend((f.tell(), len(field)))
+                f.write(field)
+            table.append(ENTRY.pack(*entry))
+        table_offset = f.tell()
+        f.write(b''.join(table))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, PACK_VERSION, len(table), table_offset))
+    return len(table)
+
+
+class StoryPack:
+    """Read-only, memory-mapped access to a pack written by write_pack.
+
+    Stories are addressed by index, from 0. text() and image() return
+    memoryviews into the mapping. Views still alive at close() stay valid:
+    the mapping is then unmapped when the last of them is dropped.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        try:
+            magic, version, self._count, self._table = HEADER.unpack_from(self._map)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != PACK_VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a version {PACK_VERSION} story pack')
+
+    def __len__(self):
+        return self._count
+
+    def _field(self, index, field):
+        if not 0 <= index < self._count:
+            raise IndexError(f'story index {index} out of range')
+        position = FIELDS.index(field) * 2
+        entry = ENTRY.unpack_from(self._map, self._table + index * ENTRY.size)
+        offset, length = entry[position], entry[position + 1]
+        return self._view[offset:offset + length]
+
+    def title(self, index):
+        return str(self._field(index, 'title'), 'utf-8')
+
+    def theme(self, index):
+        return str(self._field(index, 'theme'), 'utf-8')
+
+    def text(self, index):
+        """The story's text as a memoryview of UTF-8 bytes."""
+        return self._field(index, 'text')
+
+    def image(self, index):
+        """The illustration's bytes as a memoryview, or None if the story has none."""
+        image = self._field(index, 'image')
+        return image if len(image) else None
+
+    def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:  # views handed out keep the mapping alive until they are dropped
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
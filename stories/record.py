@@ -0,0 +1,42 @@
+"""The Story record."""
+
+import os
+
+from story_images import illustration_bytes
+from story_tokenizer import story_text, story_theme, story_title
+
+
+class Story:
+    """One story: where it came from, its title, theme and text, and its picture.
+
+    `html` and `illustration_html` are the blocks as they appear in the
+    page. The illustration is kept as that markup (a base64 data: URI or a
+    path) and only decoded when `illustration` is read.
+    """
+
+    __slots__ = ('source', 'number', 'title', 'theme', 'text', 'html', 'illustration_html')
+
+    def __init__(self, source, number, title, theme, text, html='', illustration_html=''):
+        self.source = source
+        self.number = number
+        self.title = title
+        self.theme = theme
+        self.text = text
+        self.html = html
+        self.illustration_html = illustration_html
+
+    @classmethod
+    def from_html(cls, source, number, story_html, illustration_html=''):
+        """Build a Story from a (story, illustration) pair of StoryTokenizer blocks."""
+        return cls(source, number, story_title(story_html), story_theme(story_html), story_text(story_html),
+                   story_html, illustration_html)
+
+    @property
+    def illustration(self):
+        """The image bytes behind the story's <img>, or None if it has none or it is missing."""
+        if not self.illustration_html:
+            return None
+        return illustration_bytes(self.illustration_html, os.path.dirname(self.source))
+
+    def __repr__(self):
+        return f'Story({self.source!r}, {self.number}, {self.title!r})'
@@ -0,0 +1,100 @@
+"""An inverted index of the stories, sharded into small files for the browser.
+
+Every story's title and text is split into lowercase terms (see tokenize).
+Each term's postings list the stories it occurs in and how often, as
+alternating [story gap, term frequency] pairs: the first gap is the story's
+number, each later one the difference from the previous story, which keeps
+the JSON short. Terms are grouped into shards by their first SHARD_PREFIX
+characters, so a search page only fetches the shards of the words typed.
+search.html's script and search() below rank matches with BM25.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+
+INDEX_VERSION = 2
+SHARD_PREFIX = 2
+# Shard for terms that don't start with SHARD_PREFIX ASCII letters/digits
+OTHER_SHARD = '_'
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Letters and digits; the same as search.html's /[\p{L}\p{N}]+/gu
+_TOKEN = re.compile(r'[^\W_]+')
+_SHARD_KEY = re.compile(r'[a-z0-9]+')
+
+# Too common to be worth a posting in every story
+STOP_WORDS = frozenset("""
+    a about after all an and are as at be been but by can could did do for from had has have he her him his
+    i if in into is it its just me my no not now of on one or our out over she so than that the their them
+    then there they this to up was we were what when which who will with would you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercase terms in text, without stop words and single characters."""
+    return [term for term in _TOKEN.findall(text.lower()) if len(term) > 1 and term not in STOP_WORDS]
+
+
+def shard_key(term):
+    prefix = term[:SHARD_PREFIX]
+    return prefix if _SHARD_KEY.fullmatch(prefix) else OTHER_SHARD
+
+
+def build_index(stories):
+    """Index Story records; return (docs, shards).
+
+    docs has one [title, part, theme, length in terms] per story, indexed by
+    number - 1. shards maps a shard key to {term: postings}.
+    """
+    docs = []
+    postings = defaultdict(list)
+    for story in stories:
+        terms = Counter(tokenize(f'{story.title}\n{story.text}'))
+        docs.append([story.title, story.source, story.theme, sum(terms.values())])
+        for term, frequency in terms.items():
+            postings[term].append((story.number, frequency))
+
+    shards = defaultdict(dict)
+    for term in sorted(postings):
+        encoded = []
+        previous = 0
+        for number, frequency in postings[term]:
+            encoded.extend((number - previous, frequency))
+            previous = number
+        shards[shard_key(term)][term] = encoded
+    return docs, dict(shards)
+
+
+def decode_postings(encoded):
+    """Turn [gap, frequency, ...] back into [(story number, frequency), ...]."""
+    number = 0
+    decoded = []
+    for i in range(0, len(encoded), 2):
+        number += encoded[i]
+        decoded.append((number, encoded[i + 1]))
+    return decoded
+
+
+def search(docs, shards, query, limit=20):
+    """Rank stories for query with BM25; return [(story number, score), ...], best first.
+
+    Mirrors the ranking in search.html, for checking it from Python.
+    """
+    count = len(docs)
+    if not count:
+        return []
+    average_length = sum(doc[3] for doc in docs) / count
+    scores = Counter()
+    for term in set(tokenize(query)):
+        matches = decode_postings(shards.get(shard_key(term), {}).get(term, []))
+        if not matches:
+            continue
+        idf = math.log(1 + (count - len(matches) + 0.5) / (len(matches) + 0.5))
+        for number, frequency in matches:
+            length = docs[number - 1][3]
+            scores[number] += idf * frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average_length))
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
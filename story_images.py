@@ -0,0 +1,411 @@
+"""Helpers for the base64 illustrations embedded in the story pages.
+
+Also holds the file helpers the build scripts share: file_digest, and
+atomic_open/write_file, which write to a temp name and rename it into place
+so a reader never sees a half-written file.
+"""
+
+import base64
+import contextlib
+import hashlib
+import io
+import os
+import re
+import struct
+from collections import Counter
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is only needed for responsive re-encoding
+    Image = None
+
+# Where externalized illustrations go, relative to the part files
+STORY_IMAGE_DIR = 'images/stories'
+
+DATA_URI = re.compile(r'src="data:image/(png|jpeg|gif|webp);base64,([A-Za-z0-9+/=\s]*)"')
+IMG_TAG = re.compile(r'<img\b[^>]*>')
+IMG_SRC = re.compile(r'<img\b[^>]*?\ssrc="([^"]*)"')
+_SRC_START = re.compile(r'\ssrc="')
+# A URL with a scheme or an absolute path, rather than a file next to the page
+_REMOTE = re.compile(r'^[a-z][a-z0-9+.-]*:|^/', re.IGNORECASE)
+
+# Read files in 1MB chunks when hashing them
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+EXTENSIONS = {'png': 'png', 'jpeg': 'jpg', 'gif': 'gif', 'webp': 'webp', 'avif': 'avif'}
+
+# An image's size is in its first few bytes: PNG's IHDR, GIF's screen
+# descriptor, WebP's VP8 header, AVIF's ispe property in the meta box, or a
+# JPEG's SOF marker, which comes after any Exif/ICC segments (at most 64KB
+# each)
+IMAGE_HEADER_BYTES = 64 * 1024
+# Most headers fit in this much, so that is tried first
+SHORT_HEADER_BYTES = 4 * 1024
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+AVIF_BRANDS = (b'avif', b'avis')
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Re-encoded variants, best format first. The illustrations are 768px square
+# and shown in a column at most 760px wide (.content-wrapper minus padding).
+RESPONSIVE_FORMATS = ('webp',)
+RESPONSIVE_WIDTHS = (320, 480, 768)
+RESPONSIVE_SIZES = '(max-width: 800px) 100vw, 760px'
+ENCODER_OPTIONS = {
+    'webp': {'quality': 80, 'method': 6},
+    'avif': {'quality': 60},
+}
+
+
+@contextlib.contextmanager
+def atomic_open(path, mode='wb'):
+    """Open a temp file next to path for writing and move it over path on success.
+
+    Text modes use UTF-8 and keep newlines as written. If the block raises,
+    the temp file is removed and path is left as it was.
+    """
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    text = {} if 'b' in mode else {'encoding': 'utf-8', 'newline': ''}
+    try:
+        with open(temp_path, mode, **text) as f:
+            yield f
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+
+def write_file(path, data):
+    """Replace path with data, bytes or (written as UTF-8) str, in one rename."""
+    with atomic_open(path, 'w' if isinstance(data, str) else 'wb') as f:
+        f.write(data)
+
+
+def file_digest(path):
+    """sha256 hex digest of the file at path, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_image(data, extension, image_dir=STORY_IMAGE_DIR):
+    """Write data to image_dir/<sha256>.<extension> once and return that path.
+
+    Files are content-addressed, so an existing file already holds these bytes
+    and is left alone.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = f'{image_dir}/{digest}.{extension}'
+    if not os.path.exists(path):
+        os.makedirs(image_dir, exist_ok=True)
+        write_file(path, data)
+    return path
+
+
+def _jpeg_size(header):
+    pos = 2
+    while pos + 9 <= len(header):
+        if header[pos] != 0xFF:
+            return None
+        marker = header[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack('>HH', header[pos + 5:pos + 9])
+            return width, height
+        if marker == 0xD9 or marker == 0xDA:  # end of image / start of scan
+            return None
+        pos += 2 + struct.unpack('>H', header[pos + 2:pos + 4])[0]
+    return None
+
+
+def _is_avif(header):
+    # An ISO BMFF ftyp box naming an AVIF brand, as the major or a compatible one
+    if header[4:8] != b'ftyp' or len(header) < 16:
+        return False
+    size = struct.unpack('>I', header[:4])[0]
+    brands = header[8:12] + header[16:min(size, len(header))]
+    return any(brands[i:i + 4] in AVIF_BRANDS for i in range(0, len(brands) - 3, 4))
+
+
+def _avif_size(header):
+    # The first image spatial extents property, which encoders write for the primary image
+    pos = header.find(b'ispe')
+    if pos == -1 or pos + 16 > len(header):
+        return None
+    return struct.unpack('>II', header[pos + 8:pos + 16])
+
+
+def image_format(header):
+    """Return 'png', 'jpeg', 'gif', 'webp' or 'avif' from an image's first bytes, or None.
+
+    The data: URIs don't always name the format correctly, so it is sniffed.
+    """
+    if header[:8] == PNG_SIGNATURE:
+        return 'png'
+    if header[:3] == b'\xff\xd8\xff':
+        return 'jpeg'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    if _is_avif(header):
+        return 'avif'
+    return None
+
+
+def image_size(header):
+    """Return (width, height) from the start of a PNG, JPEG, GIF, WebP or AVIF file, or None.
+
+    Only the headers are read; nothing is decoded.
+    """
+    fmt = image_format(header)
+    if fmt == 'png' and header[12:16] == b'IHDR' and len(header) >= 24:
+        return struct.unpack('>II', header[16:24])
+    if fmt == 'jpeg':
+        return _jpeg_size(header)
+    if fmt == 'gif' and len(header) >= 10:
+        return struct.unpack('<HH', header[6:10])
+    if fmt == 'webp' and len(header) >= 30:
+        chunk = header[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', header[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L':
+            bits = int.from_bytes(header[21:25], 'little')
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b'VP8X':
+            return int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1
+    if fmt == 'avif':
+        return _avif_size(header)
+    return None
+
+
+def image_extension(data, label):
+    """File extension for the image in data: its sniffed format, else the data: URI's label."""
+    return EXTENSIONS.get(image_format(data[:64])) or EXTENSIONS[label]
+
+
+def image_info(data):
+    """Return {'format', 'width', 'height', 'bytes'} for an image from its header.
+
+    format, width and height are None if the header isn't recognised.
+    """
+    header = data[:IMAGE_HEADER_BYTES]
+    size = image_size(header) or (None, None)
+    return {'format': image_format(header), 'width': size[0], 'height': size[1], 'bytes': len(data)}
+
+
+def image_header(src, base_dir='.', limit=IMAGE_HEADER_BYTES):
+    """Return up to limit bytes from the start of the image at src, or None.
+
+    src is a base64 data: URI, of which only that much is decoded, or a path
+    relative to base_dir.
+    """
+    if src.startswith('data:'):
+        comma = src.find(',')
+        if comma == -1 or not src[:comma].endswith(';base64'):
+            return None
+        # Whole 4-character groups covering at least limit bytes
+        payload = ''.join(src[comma + 1:comma + 1 + limit * 2].split())
+        payload = payload[:-(-limit // 3) * 4]
+        try:
+            return base64.b64decode(payload[:len(payload) // 4 * 4])
+        except ValueError:
+            return None
+    if _REMOTE.match(src):
+        return None
+    try:
+        with open(os.path.join(base_dir, src), 'rb') as f:
+            return f.read(limit)
+    except OSError:
+        return None
+
+
+def _has_attr(attrs, name):
+    return re.search(rf'\s{name}\s*=', attrs, re.IGNORECASE) is not None
+
+
+def lazy_image_tag(tag, base_dir='.'):
+    """Add loading="lazy", decoding="async" and width/height to an <img> tag.
+
+    The size comes from the image's header (see image_size), so the browser
+    can reserve the space without decoding the image. Attributes the tag
+    already has are kept.
+    """
+    # The src value can be 200KB of base64, so it is found with str.find
+    # and left out of the attribute checks rather than run through regexes
+    src = None
+    attrs = tag
+    src_start = _SRC_START.search(tag)
+    if src_start is not None:
+        src_end = tag.find('"', src_start.end())
+        if src_end != -1:
+            src = tag[src_start.end():src_end]
+            attrs = tag[:src_start.end()] + tag[src_end:]
+
+    extra = []
+    if not _has_attr(attrs, 'loading'):
+        extra.append('loading="lazy"')
+    if not _has_attr(attrs, 'decoding'):
+        extra.append('decoding="async"')
+    if src is not None and not _has_attr(attrs, 'width') and not _has_attr(attrs, 'height'):
+        header = image_header(src, base_dir, SHORT_HEADER_BYTES) or b''
+        size = image_size(header)
+        if size is None and len(header) >= SHORT_HEADER_BYTES:
+            size = image_size(image_header(src, base_dir) or b'')
+        if size is not None:
+            extra.append(f'width="{size[0]}" height="{size[1]}"')
+    if not extra:
+        return tag
+    return f'<img {" ".join(extra)}{tag[4:]}'
+
+
+def lazy_images(html, base_dir='.'):
+    """Apply lazy_image_tag to every <img> in html."""
+    parts = []
+    pos = 0
+    while True:
+        start = html.find('<img', pos)
+        end = html.find('>', start)
+        if start == -1 or end == -1:
+            break
+        if html[start + 4:start + 5].isalnum():  # e.g. <imgs>, not an <img>
+            parts.append(html[pos:start + 4])
+            pos = start + 4
+            continue
+        parts.append(html[pos:start])
+        parts.append(lazy_image_tag(html[start:end + 1], base_dir))
+        pos = end + 1
+    parts.append(html[pos:])
+    return ''.join(parts)
+
+
+def externalize_images(html, image_dir=STORY_IMAGE_DIR, base_dir='.'):
+    """Swap every base64 data: URI in html for a content-addressed image file.
+
+    base_dir is the directory of the page html goes in: files are written to
+    base_dir/image_dir and the srcs point at image_dir/<sha256>.<ext> from
+    there. The <img> tags also get lazy loading and their size (see
+    lazy_image_tag).
+    """
+    def replace(match):
+        data = base64.b64decode(match.group(2))
+        path = write_image(data, image_extension(data, match.group(1)), os.path.join(base_dir, image_dir))
+        return f'src="{image_dir}/{os.path.basename(path)}"'
+
+    return DATA_URI.sub(replace, lazy_images(html, base_dir))
+
+
+def rebase_images(html, from_dir, to_dir):
+    """Make the relative <img> srcs in html, which are relative to from_dir, relative to to_dir."""
+    def replace(match):
+        src = match.group(1)
+        if src.startswith('data:') or _REMOTE.match(src):
+            return match.group(0)
+        rebased = os.path.relpath(os.path.join(from_dir, src), to_dir).replace(os.sep, '/')
+        return match.group(0)[:match.start(1) - match.start()] + rebased + '"'
+
+    return IMG_SRC.sub(replace, html)
+
+
+def image_src(html):
+    """Return the src of the first <img> in html, or None if it is missing or inline."""
+    match = IMG_SRC.search(html)
+    if match is None or match.group(1).startswith('data:'):
+        return None
+    return match.group(1)
+
+
+def illustration_bytes(html, base_dir='.'):
+    """Return the image behind the first <img> in html: inline base64 or a file relative to base_dir."""
+    uri = DATA_URI.search(html)
+    if uri is not None:
+        return base64.b64decode(uri.group(2))
+    src = image_src(html)
+    if src is None or _REMOTE.match(src):
+        return None
+    try:
+        with open(os.path.join(base_dir, src), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def supported_formats(formats):
+    """Return the formats in formats that the installed Pillow can encode."""
+    if Image is None:
+        return []
+    Image.init()
+    return [fmt for fmt in formats if fmt.upper() in Image.SAVE]
+
+
+def encode_variants(data, image_dir=STORY_IMAGE_DIR, formats=RESPONSIVE_FORMATS,
+                    widths=RESPONSIVE_WIDTHS):
+    """Write downscaled re-encodes of the image in data.
+
+    Returns {format: [(path, width, byte_size), ...]} with widths ascending.
+    Variants are named <sha256 of the source>-<width>w.<format>, so a rerun
+    only encodes images it has not seen before.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    source = None
+    variants = {}
+    for fmt in formats:
+        variants[fmt] = []
+        for width in widths:
+            path = f'{image_dir}/{digest}-{width}w.{fmt}'
+            if not os.path.exists(path):
+                if source is None:
+                    source = Image.open(io.BytesIO(data))
+                    source.load()
+                    if source.mode not in ('RGB', 'RGBA'):
+                        source = source.convert('RGBA')
+                # Never upscale; the largest variant is the native width
+                if width > source.width:
+                    continue
+                height = round(source.height * width / source.width)
+                image = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+                encoded = io.BytesIO()
+                image.save(encoded, fmt.upper(), **ENCODER_OPTIONS.get(fmt, {}))
+                os.makedirs(image_dir, exist_ok=True)
+                write_file(path, encoded.getvalue())
+            variants[fmt].append((path, width, os.path.getsize(path)))
+    return variants
+
+
+def responsive_images(html, image_dir=STORY_IMAGE_DIR, formats=RESPONSIVE_FORMATS):
+    """Replace each base64 <img> in html with a <picture> of re-encoded variants.
+
+    The original image is externalized as the <img> fallback. Returns the new
+    html and a Counter of bytes: 'inline' for the decoded images removed
+    (not their longer base64), and one entry per format for its full-width
+    variants.
+    """
+    sizes = Counter()
+
+    def replace(match):
+        uri = DATA_URI.search(match.group(0))
+        if uri is None:
+            return match.group(0)
+        tag = lazy_image_tag(match.group(0))
+        uri = DATA_URI.search(tag)
+        data = base64.b64decode(uri.group(2))
+        sizes['inline'] += len(data)
+        fallback = write_image(data, image_extension(data, uri.group(1)), image_dir)
+
+        sources = []
+        for fmt, variants in encode_variants(data, image_dir, formats).items():
+            if not variants:
+                continue
+            srcset = ', '.join(f'{path} {width}w' for path, width, _ in variants)
+            sources.append(f'<source type="image/{fmt}" srcset="{srcset}" sizes="{RESPONSIVE_SIZES}">')
+            sizes[fmt] += variants[-1][2]
+
+        img = tag[:uri.start()] + f'src="{fallback}"' + tag[uri.end():]
+        return f'<picture>{"".join(sources)}{img}</picture>'
+
+    return IMG_TAG.sub(replace, html), sizes
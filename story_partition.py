@@ -0,0 +1,64 @@
+"""Size-balanced partitioning of the story corpus into part files.
+
+Stories keep their order, so a partition is a list of run lengths over the
+sequence of story blocks. Part boundaries are placed greedily at the block
+edge nearest each equal share of the total size, so every part ends up
+within about one story of the average.
+"""
+
+import bisect
+import math
+import re
+
+_SIZE = re.compile(r'^(\d+(?:\.\d+)?)\s*([KMG]?)B?$', re.IGNORECASE)
+_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text):
+    """Parse a byte size like '16M', '512K' or '2000000'."""
+    match = _SIZE.match(text.strip())
+    if not match:
+        raise ValueError(f'not a size: {text!r}')
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+def count_parts(sizes, target_bytes=None, target_stories=None):
+    """Return how many parts reach target_bytes per part or target_stories per part."""
+    if not sizes:
+        return 0
+    if target_bytes:
+        count = math.ceil(sum(sizes) / target_bytes)
+    elif target_stories:
+        count = math.ceil(len(sizes) / target_stories)
+    else:
+        raise ValueError('need target_bytes or target_stories')
+    return max(1, min(count, len(sizes)))
+
+
+def balanced_parts(sizes, part_count):
+    """Split sizes (in order) into part_count runs of near-equal total size.
+
+    Returns the number of blocks in each run. Every run holds at least one
+    block.
+    """
+    if part_count <= 0 or not sizes:
+        return []
+    part_count = min(part_count, len(sizes))
+
+    prefix = [0]
+    for size in sizes:
+        prefix.append(prefix[-1] + size)
+    total = prefix[-1]
+
+    cuts = [0]
+    for i in range(1, part_count):
+        target = total * i / part_count
+        # Nearest block edge to this share, leaving room for the parts after it
+        cut = bisect.bisect_left(prefix, target)
+        if cut > 0 and target - prefix[cut - 1] < prefix[cut] - target:
+            cut -= 1
+        cut = max(cuts[-1] + 1, min(cut, len(sizes) - (part_count - i)))
+        cuts.append(cut)
+    cuts.append(len(sizes))
+
+    return [end - start for start, end in zip(cuts, cuts[1:])]
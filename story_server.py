@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Static file server for the story site.
+
+A drop-in replacement for `python3 -m http.server` that copes with the 18MB
+part files: a thread per connection, HTTP/1.1 keep-alive, single Range
+requests (so a client can fetch one story using stories-manifest.json),
+strong ETags with If-None-Match/If-Range, precompressed .br/.gz sidecars and
+sendfile() for the body.
+
+    python3 story_server.py 8000
+"""
+
+import argparse
+import email.utils
+import functools
+import os
+import re
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Precompressed sidecars in order of preference: (Content-Encoding, suffix)
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+# Content-addressed files (images/stories/<sha256>..., styles/<name>.<hash>.css,
+# js/<name>.<hash>.js) never change
+IMMUTABLE = re.compile(r'/[0-9a-f]{64}(-\d+w)?\.\w+$|/[\w-]+\.[0-9a-f]{16}\.(css|js)$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_QUALITY = re.compile(r'\bq=([0-9.]+)')
+
+
+def accepted_encodings(header):
+    """Return the content codings an Accept-Encoding header allows."""
+    accepted = set()
+    for item in (header or '').split(','):
+        name, _, params = item.partition(';')
+        quality = _QUALITY.search(params)
+        try:
+            if quality and float(quality.group(1)) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def parse_range(header, size):
+    """Turn a Range header into an inclusive (start, end), or None to serve it all.
+
+    Raises ValueError if the range can't be satisfied. Multiple ranges are
+    answered with the whole file, which RFC 9110 allows.
+    """
+    match = _RANGE.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+class StoryRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    extensions_map = {
+        **SimpleHTTPRequestHandler.extensions_map,
+        '.avif': 'image/avif',
+        '.json': 'application/json',
+        '.webp': 'image/webp',
+    }
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def serve(self, send_body):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            index = self.directory_index(path)
+            if index is None:
+                # Redirects and directory listings work as in http.server
+                return super().do_GET() if send_body else super().do_HEAD()
+            path = index
+        elif self.path.split('?', 1)[0].split('#', 1)[0].endswith('/'):
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return
+
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return
+
+        stat = os.fstat(f.fileno())
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        content_type = self.guess_type(path)
+        range_header = self.headers.get('Range')
+        headers = {
+            'Last-Modified': self.date_time_string(int(stat.st_mtime)),
+            'Cache-Control': IMMUTABLE_CACHE if IMMUTABLE.search(path) else REVALIDATE_CACHE,
+            'Vary': 'Accept-Encoding',
+        }
+
+        # Byte ranges always refer to the identity file, so only whole-file
+        # responses are served from a sidecar
+        encoding = None
+        if range_header is None:
+            sidecar = self.precompressed(path, stat)
+            if sidecar is not None:
+                f.close()
+                encoding, f = sidecar
+                etag = f'{etag[:-1]}-{encoding}"'
+        headers['ETag'] = etag
+
+        with f:
+            if self.not_modified(etag, stat.st_mtime):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                return
+
+            size = os.fstat(f.fileno()).st_size
+            start, end = 0, size - 1
+            status = HTTPStatus.OK
+            if range_header is not None and self.headers.get('If-Range', etag) == etag:
+                try:
+                    requested = parse_range(range_header, size)
+                except ValueError:
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if requested is not None:
+                    start, end = requested
+                    status = HTTPStatus.PARTIAL_CONTENT
+
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            if status == HTTPStatus.PARTIAL_CONTENT:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+
+            if send_body and end >= start:
+                try:
+                    # Zero-copy from the page cache where the OS supports it
+                    self.connection.sendfile(f, start, end - start + 1)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+    def directory_index(self, path):
+        """Return the index.html/index.htm to serve for a directory URL, if any."""
+        if not self.path.split('?', 1)[0].split('#', 1)[0].endswith('/'):
+            return None
+        for index in ('index.html', 'index.htm'):
+            index_path = os.path.join(path, index)
+            if os.path.isfile(index_path):
+                return index_path
+        return None
+
+    def precompressed(self, path, stat):
+        """Open the best up-to-date sidecar the client accepts: (encoding, file) or None."""
+        accepted = accepted_encodings(self.headers.get('Accept-Encoding'))
+        for encoding, suffix in PRECOMPRESSED:
+            if encoding not in accepted:
+                continue
+            try:
+                sidecar = open(path + suffix, 'rb')
+            except OSError:
+                continue
+            # A sidecar older than its source is stale
+            if os.fstat(sidecar.fileno()).st_mtime >= stat.st_mtime:
+                return encoding, sidecar
+            sidecar.close()
+        return None
+
+    def not_modified(self, etag, mtime):
+        """True if the request's validators show the client's copy is current."""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or f'W/{etag}' in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return int(mtime) <= since.timestamp()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the story site with Range, ETag and precompressed files')
+    parser.add_argument('port', nargs='?', type=int, default=8000, help='port to listen on (default: %(default)s)')
+    parser.add_argument('--bind', '-b', default='', help='address to bind to (default: all interfaces)')
+    parser.add_argument('--directory', '-d', default=os.getcwd(), help='directory to serve (default: current)')
+    args = parser.parse_args()
+
+    handler = functools.partial(StoryRequestHandler, directory=args.directory)
+    with ThreadingHTTPServer((args.bind, args.port), handler) as httpd:
+        host, port = httpd.socket.getsockname()[:2]
+        print(f"Serving {args.directory} on http://{host if host not in ('', '0.0.0.0') else 'localhost'}:{port}/")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\nStopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Single-pass tokenizer for the illustrated story pages.
+
+Walks the HTML once, tracking <div> depth, and pairs every
+<div class="story"> with the <div class="story-illustration"> that directly
+follows it. The source is read in chunks and only the block being tokenized
+is buffered, so memory is bounded by the largest story (a few hundred KB of
+base64) no matter how big the file is.
+
+    with open('illustrated-stories-5.html', encoding='utf-8') as f:
+        tokens = StoryTokenizer(f)
+        header = tokens.header
+        for story_html, illustration_html in tokens:
+            ...
+"""
+
+import html
+import re
+
+# Read the source in 64KB chunks; larger reads fragment the heap and let RSS
+# creep up with corpus size
+CHUNK_SIZE = 64 * 1024
+
+STORY_CLASS = 'story'
+ILLUSTRATION_CLASS = 'story-illustration'
+
+_DIV_TAG = re.compile(r'<(/?)div\b[^>]*>', re.IGNORECASE)
+_CLASS_ATTR = re.compile(r'\bclass\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+# Part files use .story-title/.theme; test-stories.html puts the title in an <h2>
+_TITLE = re.compile(r'<div class="story-title">(.*?)</div>|<h2>(.*?)</h2>', re.DOTALL)
+_THEME = re.compile(r'<div class="theme">\s*(?:Theme:\s*)?(.*?)</div>', re.DOTALL)
+# Part files keep the text in .story-content; test-stories.html uses <p>s
+_CONTENT = re.compile(r'<div class="story-content">(.*?)</div>', re.DOTALL)
+_PARAGRAPH = re.compile(r'<p\b[^>]*>(.*?)</p>', re.DOTALL | re.IGNORECASE)
+
+
+def _has_class(tag, name):
+    match = _CLASS_ATTR.search(tag)
+    return match is not None and name in match.group(1).split()
+
+
+def _may_be_div_tag(text):
+    """True if text (which starts with '<') could grow into a <div> or </div> tag."""
+    text = text.lower()
+    return any(prefix.startswith(text[:len(prefix)]) for prefix in ('<div', '</div'))
+
+
+class StoryTokenizer:
+    """Iterate (story_html, illustration_html) pairs from a file object.
+
+    `header` is everything before the first story. A story without an
+    illustration is yielded with an empty illustration rather than being
+    glued to the next story's image.
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._eof = False
+        self._header = None
+
+    def _fill(self):
+        """Append the next chunk to the buffer; return False at end of file."""
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer += chunk
+        return True
+
+    def _next_tag(self, pos):
+        """Return the next complete <div>/</div> tag at or after pos, or None at EOF."""
+        while True:
+            match = _DIV_TAG.search(self._buffer, pos)
+            if match:
+                return match
+            # Only a tag cut off at the end of the buffer needs rescanning;
+            # everything before it (e.g. a base64 payload) is done with
+            cut = self._buffer.rfind('<', pos)
+            if cut != -1 and _may_be_div_tag(self._buffer[cut:cut + 5]):
+                pos = cut
+            else:
+                pos = len(self._buffer)
+            if not self._fill():
+                return None
+
+    def _next_open(self, pos, name):
+        """Return the next opening div tag with class name at or after pos."""
+        while True:
+            match = self._next_tag(pos)
+            if match is None or (not match.group(1) and _has_class(match.group(0), name)):
+                return match
+            pos = match.end()
+
+    def _block_end(self, opening, stop_at_story=False):
+        """Return the offset just past the </div> matching opening, or None at EOF.
+
+        With stop_at_story, a nested <div class="story"> ends the block just
+        before it, which recovers from illustrations whose </div> went missing.
+        """
+        depth = 1
+        pos = opening.end()
+        while depth:
+            match = self._next_tag(pos)
+            if match is None:
+                return None
+            if match.group(1):
+                depth -= 1
+            elif stop_at_story and _has_class(match.group(0), STORY_CLASS):
+                return match.start()
+            else:
+                depth += 1
+            pos = match.end()
+        return pos
+
+    @property
+    def header(self):
+        """Everything before the first story (the whole file if there is none)."""
+        if self._header is None:
+            first = self._next_open(0, STORY_CLASS)
+            start = first.start() if first else len(self._buffer)
+            self._header = self._buffer[:start]
+            self._buffer = self._buffer[start:]
+        return self._header
+
+    def __iter__(self):
+        self.header
+        pos = 0
+        while True:
+            # Drop the finished block so the buffer never holds more than one
+            self._buffer = self._buffer[pos:]
+            opening = self._next_open(0, STORY_CLASS)
+            if opening is None:
+                return
+            end = self._block_end(opening)
+            if end is None:
+                return
+            story = self._buffer[opening.start():end]
+
+            illustration = ''
+            pos = end
+            following = self._next_tag(end)
+            if (following is not None and not following.group(1)
+                    and _has_class(following.group(0), ILLUSTRATION_CLASS)
+                    and not self._buffer[end:following.start()].strip()):
+                illustration_end = self._block_end(following, stop_at_story=True)
+                if illustration_end is not None:
+                    illustration = self._buffer[following.start():illustration_end]
+                    pos = illustration_end
+
+            yield story, illustration
+
+
+def _text(fragment):
+    return html.unescape(re.sub(r'<[^>]*>', '', fragment)).strip()
+
+
+def story_title(story_html):
+    """Return the plain-text title of a story block, or '' if it has none."""
+    match = _TITLE.search(story_html)
+    return _text(match.group(1) or match.group(2) or '') if match else ''
+
+
+def story_theme(story_html):
+    """Return a story's theme without the 'Theme:' prefix, or '' if it has none."""
+    match = _THEME.search(story_html)
+    return _text(match.group(1)) if match else ''
+
+
+def normalize_theme(theme):
+    """Fold a theme to the form used for grouping: lowercase, single spaces, no trailing punctuation."""
+    return ' '.join(theme.lower().split()).strip(' .,;:!?"\'')
+
+
+def theme_slug(theme):
+    """A file-name-safe version of a normalized theme, e.g. 'friendly-dragons-and-castles'."""
+    return re.sub(r'[^a-z0-9]+', '-', theme.lower()).strip('-') or 'theme'
+
+
+def story_text(story_html):
+    """Return a story's plain text, paragraphs separated by blank lines."""
+    match = _CONTENT.search(story_html)
+    if match:
+        return _text(match.group(1))
+    return '\n\n'.join(filter(None, (_text(p) for p in _PARAGRAPH.findall(story_html))))
+
+
+def iter_stories(f, chunk_size=CHUNK_SIZE):
+    """Yield (story_html, illustration_html) pairs from f, skipping the header."""
+    return iter(StoryTokenizer(f, chunk_size))
@@ -0,0 +1,51 @@
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+
+spec = importlib.util.spec_from_file_location(
+    'build_search_index', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                       'build-search-index.py'))
+build_search_index = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(build_search_index)
+
+
+class StoryLocationsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.part = os.path.join(self.directory.name, 'part-1.html')
+        with open(self.part, 'wb') as f:
+            f.write(b'x' * 100)
+        self.manifest = os.path.join(self.directory.name, 'manifest.json')
+        self.docs = [['Story 1', self.part, '', 5], ['Story 2', self.part, '', 7]]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_manifest(self, part_bytes, titles):
+        stories = [{'id': i, 'part': self.part, 'title': title, 'offset': 10 * i, 'length': 10}
+                   for i, title in enumerate(titles, 1)]
+        with open(self.manifest, 'w', encoding='utf-8') as f:
+            json.dump({'parts': [{'file': self.part, 'bytes': part_bytes}], 'stories': stories}, f)
+
+    def test_matching_manifest(self):
+        self.write_manifest(100, ['Story 1', 'Story 2'])
+        sizes, locations = build_search_index.story_locations(self.docs, self.manifest)
+        self.assertEqual(sizes, {self.part: 100})
+        self.assertEqual(locations, [[10, 10], [20, 10]])
+
+    def test_part_changed_since_split(self):
+        self.write_manifest(99, ['Story 1', 'Story 2'])
+        self.assertEqual(build_search_index.story_locations(self.docs, self.manifest), ({}, [None, None]))
+
+    def test_stories_out_of_step(self):
+        self.write_manifest(100, ['Story 2', 'Story 1'])
+        self.assertEqual(build_search_index.story_locations(self.docs, self.manifest), ({}, [None, None]))
+
+    def test_no_manifest(self):
+        self.assertEqual(build_search_index.story_locations(self.docs, self.manifest), ({}, [None, None]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from stories import Catalog
+from stories.catalog import fts_query
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head><title>Test stories</title></head>
+<body>
+<div class="content-wrapper">
+    <div class="story">
+        <div class="story-title">Story 1</div>
+        <div class="theme">Theme: friendly dragons and castles</div>
+        <div class="story-content">Peep's hat blew into the dragon's castle.</div>
+    </div>
+    <div class="story">
+        <div class="story-title">Story 2</div>
+        <div class="theme">Theme: underwater treasure hunt</div>
+        <div class="story-content">Nugget found a "golden" egg under the sea.</div>
+    </div>
+</div>
+</body>
+</html>
+'''
+
+
+class CatalogSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        page = os.path.join(self.directory.name, 'stories.html')
+        with open(page, 'w', encoding='utf-8') as f:
+            f.write(PAGE)
+        self.catalog = Catalog(os.path.join(self.directory.name, 'stories.db'))
+        self.catalog.refresh([page])
+        if not self.catalog.has_search:
+            self.skipTest('this SQLite has no FTS5')
+
+    def tearDown(self):
+        self.catalog.close()
+        self.directory.cleanup()
+
+    def numbers(self, query):
+        return [row['number'] for row in self.catalog.search(query)]
+
+    def test_words(self):
+        self.assertEqual(self.numbers('golden egg'), [2])
+        self.assertEqual(self.numbers('dragon sea'), [])
+        self.assertEqual(self.numbers('castle'), [1])
+
+    def test_punctuation_is_literal(self):
+        self.assertEqual(self.numbers("Peep's hat"), [1])
+        self.assertEqual(self.numbers('"egg'), [2])
+        self.assertEqual(self.numbers('"golden" AND NOT-a-word'), [])
+        self.assertEqual(self.numbers('egg*'), [2])
+
+    def test_empty_query(self):
+        self.assertEqual(self.numbers('   '), [])
+
+
+class FtsQueryTest(unittest.TestCase):
+    def test_quotes_each_word(self):
+        self.assertEqual(fts_query("Peep's  hat"), '"Peep\'s" "hat"')
+        self.assertEqual(fts_query('"egg'), '"""egg"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+from image_index import image_files, load_index, update_index
+
+spec = importlib.util.spec_from_file_location(
+    'dedupe_images', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dedupe-images.py'))
+dedupe = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(dedupe)
+
+
+def picture(seed, size=(200, 150)):
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', size, (30 * seed % 255, 100, 200))
+    draw = ImageDraw.Draw(image)
+    for i in range(10):
+        left, top = i * 17 * seed % (size[0] - 20), i * 11 % (size[1] - 20)
+        draw.ellipse((left, top, left + 30, top + 20), fill=(i * 25, 255 - i * 20, seed * 40 % 255))
+    return image
+
+
+@unittest.skipIf(dedupe.Image is None, 'needs Pillow')
+class DuplicateGroupsTest(unittest.TestCase):
+    def test_same_picture_in_other_formats(self):
+        with tempfile.TemporaryDirectory() as root:
+            images = os.path.join(root, 'images')
+            os.makedirs(images)
+            original = picture(1)
+            original.save(os.path.join(images, 'a.png'))
+            original.save(os.path.join(images, 'copy.png'))
+            original.save(os.path.join(images, 'a.jpg'), quality=85)
+            original.resize((100, 75)).save(os.path.join(images, 'small.png'))
+            picture(2).save(os.path.join(images, 'other.jpg'))
+            picture(3).save(os.path.join(images, 'other.png'))
+
+            paths = image_files(images)
+            index = load_index(os.path.join(root, 'index.json'))
+            update_index(index, paths, 1)
+            groups = dedupe.duplicate_groups(index, paths)
+        self.assertEqual(groups, [[os.path.join(images, name) for name in ('a.jpg', 'a.png', 'copy.png')]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from tests.test_story_tokenizer import page
+
+spec = importlib.util.spec_from_file_location(
+    'generate_flipbook', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                      'generate-flipbook.py'))
+flipbook = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(flipbook)
+
+
+def inject(text, styles=b'<style>/*S*/</style>', script=b'<script>/*J*/</script>', chunk_size=4):
+    src = io.BytesIO(text.encode('utf-8'))
+    dst = io.BytesIO()
+    found = flipbook.inject_streaming(src, dst, styles, script, chunk_size)
+    return dst.getvalue().decode('utf-8'), found
+
+
+class InjectStreamingTest(unittest.TestCase):
+    def test_first_head_and_last_body(self):
+        text = '<html><head><title>t</title></head><body><script>"</body>"</script><p>x</p></body>\n</html>\n'
+        for chunk_size in range(1, 9):
+            with self.subTest(chunk_size=chunk_size):
+                output, found = inject(text, chunk_size=chunk_size)
+                self.assertEqual(found, (True, True))
+                self.assertEqual(output, '<html><head><title>t</title><style>/*S*/</style></head><body>'
+                                         '<script>"</body>"</script><p>x</p><script>/*J*/</script></body>'
+                                         '\n</html>\n')
+
+    def test_missing_tags_are_appended(self):
+        output, found = inject('<p>no document tags</p>')
+        self.assertEqual(found, (False, False))
+        self.assertEqual(output, '<p>no document tags</p><script>/*J*/</script><style>/*S*/</style>')
+
+
+class BuildFlipbookTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, 'stories.html')
+        with open(self.source, 'w', encoding='utf-8') as f:
+            f.write(page(3))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def build(self, name, pages_per_chunk=None):
+        output = os.path.join(self.directory.name, 'out', name)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, ok = flipbook.build_flipbook(self.source, output, pages_per_chunk)
+        self.assertTrue(ok)
+        with open(output, 'r', encoding='utf-8') as f:
+            html = f.read()
+        with open(os.path.join(os.path.splitext(output)[0], flipbook.INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.assertEqual([story['title'] for story in index['stories']], ['Story 1', 'Story 2', 'Story 3'])
+        self.assertIn(f'<meta name="flipbook-index" content="{name[:-5]}/{flipbook.INDEX_FILE}">', html)
+        self.assertLess(html.index('createPageWindow'), html.rindex('</body>'))
+        self.assertLess(html.index('<style>'), html.index('</head>'))
+        return html, output
+
+    def test_single(self):
+        html, _ = self.build('single.html')
+        self.assertIn(flipbook.flipbook_script.strip()[:200], html)
+        self.assertEqual(html.count('<div class="story">'), 3)
+        self.assertIn('loading="lazy"', html)
+        self.assertTrue(html.endswith('</body>\n</html>\n'))
+
+    def test_paginated(self):
+        html, output = self.build('paginated.html', pages_per_chunk=2)
+        self.assertIn('data-stories="3"', html)
+        self.assertIn('paginated/pages-{chunk}.json', html)
+        self.assertNotIn('<div class="story">', html)
+        chunk_dir = os.path.splitext(output)[0]
+        pages = []
+        for name in sorted(os.listdir(chunk_dir)):
+            if name.startswith('pages-'):
+                with open(os.path.join(chunk_dir, name), 'r', encoding='utf-8') as f:
+                    pages.extend(json.load(f))
+        self.assertTrue(pages)
+        self.assertIn('Story 3', ''.join(pages))
+
+
+if __name__ == '__main__':
+    unittest.main()
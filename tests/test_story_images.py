@@ -0,0 +1,86 @@
+import base64
+import io
+import os
+import struct
+import tempfile
+import unittest
+
+from story_images import image_extension, image_info, lazy_image_tag, responsive_images, supported_formats
+
+
+def jpeg_header(width, height):
+    """The start of a baseline JPEG: SOI, an APP0 segment and the SOF0 with the size."""
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    sof0 = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, height, width, 1) + b'\x01\x11\x00'
+    return b'\xff\xd8' + app0 + sof0
+
+
+def png_header(width, height):
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+
+
+def avif_header(width, height, major=b'avif'):
+    """An ftyp box and a meta box holding just the ispe property, as AVIF encoders lay them out."""
+    compatible = b'mif1miaf' + (b'MA1B' if major == b'avif' else b'avif')
+    ftyp = struct.pack('>I', 28) + b'ftyp' + major + b'\x00\x00\x00\x00' + compatible
+    ispe = struct.pack('>I', 20) + b'ispe' + b'\x00\x00\x00\x00' + struct.pack('>II', width, height)
+    return ftyp + struct.pack('>I', 12 + len(ispe)) + b'meta' + b'\x00\x00\x00\x00' + ispe
+
+
+def data_uri_tag(data, label):
+    return f'<img src="data:image/{label};base64,{base64.b64encode(data).decode("ascii")}" alt="Story 1">'
+
+
+class LazyImageTagTest(unittest.TestCase):
+    def test_png(self):
+        tag = lazy_image_tag(data_uri_tag(png_header(640, 480), 'png'))
+        self.assertIn('loading="lazy"', tag)
+        self.assertIn('decoding="async"', tag)
+        self.assertIn('width="640" height="480"', tag)
+
+    def test_jpeg_labelled_png(self):
+        # The corpus illustrations are JPEGs in data:image/png URIs
+        tag = lazy_image_tag(data_uri_tag(jpeg_header(768, 512), 'png'))
+        self.assertIn('loading="lazy"', tag)
+        self.assertIn('width="768" height="512"', tag)
+
+    def test_keeps_existing_size(self):
+        tag = lazy_image_tag('<img src="missing.jpg" width="10" height="20" loading="eager">')
+        self.assertEqual(tag, '<img decoding="async" src="missing.jpg" width="10" height="20" loading="eager">')
+
+
+class ImageExtensionTest(unittest.TestCase):
+    def test_sniffed_format_wins(self):
+        self.assertEqual(image_extension(jpeg_header(768, 768), 'png'), 'jpg')
+        self.assertEqual(image_extension(png_header(1, 1), 'jpeg'), 'png')
+
+    def test_avif(self):
+        self.assertEqual(image_extension(avif_header(320, 213), 'png'), 'avif')
+        for major in (b'avif', b'mif1'):
+            info = image_info(avif_header(320, 213, major))
+            self.assertEqual((info['format'], info['width'], info['height']), ('avif', 320, 213))
+        self.assertIsNone(image_info(b'\x00\x00\x00\x18ftypheic\x00\x00\x00\x00mif1heic')['format'])
+
+    def test_label_when_unrecognised(self):
+        self.assertEqual(image_extension(b'not an image', 'gif'), 'gif')
+
+
+@unittest.skipUnless(supported_formats(['webp']), 'needs Pillow with WebP')
+class ResponsiveImagesTest(unittest.TestCase):
+    def test_fallback_extension_is_sniffed(self):
+        from PIL import Image
+
+        encoded = io.BytesIO()
+        Image.new('RGB', (400, 400), (200, 120, 40)).save(encoded, 'JPEG')
+        with tempfile.TemporaryDirectory() as image_dir:
+            html, sizes = responsive_images(data_uri_tag(encoded.getvalue(), 'png'), image_dir)
+            fallback = [name for name in os.listdir(image_dir) if '-' not in name]
+        self.assertEqual(len(fallback), 1)
+        self.assertTrue(fallback[0].endswith('.jpg'))
+        self.assertIn(f'{image_dir}/{fallback[0]}', html)
+        self.assertIn('<source type="image/webp"', html)
+        self.assertEqual(sizes['inline'], len(encoded.getvalue()))
+
+
+if __name__ == '__main__':
+    unittest.main()
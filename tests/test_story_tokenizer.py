@@ -0,0 +1,98 @@
+import io
+import re
+import unittest
+
+from story_tokenizer import StoryTokenizer, story_text, story_theme, story_title
+
+# What split-stories-correct.py matched before the tokenizer
+LEGACY_PATTERN = re.compile(r'<div class="story">.*?</div>\s*</div>\s*<div class="story-illustration".*?</div>',
+                            re.DOTALL)
+
+HEADER = '''<!DOCTYPE html>
+<html>
+<head><title>Tales</title><style>.story { margin: 0; }</style></head>
+<body>
+<div class="content-wrapper">
+    <h1>Tales from Chickenopolis</h1>
+'''
+
+STORY = '''    <div class="story">
+        <div class="story-title">Story {n}</div>
+        <div class="theme">Theme: making new friends</div>
+        <div class="story-content">Peep &amp; Nugget met friend number {n}.
+
+They shared <b>corn</b> &lt;3 and a "golden" egg.</div>
+    </div><div class="story-illustration" data-story-index="{i}" style="text-align: center;">\
+<img src="data:image/png;base64,/9j/{payload}" alt="Story {n} illustration" class="story-image"></div>
+'''
+
+FOOTER = '''</div>
+</body>
+</html>
+'''
+
+
+def page(count=4):
+    stories = ''.join(STORY.format(n=n, i=n - 1, payload='QUJD' * n * 7) for n in range(1, count + 1))
+    return HEADER + stories + FOOTER
+
+
+def tokenize(text, chunk_size):
+    tokens = StoryTokenizer(io.StringIO(text), chunk_size)
+    return tokens.header, list(tokens)
+
+
+class StoryTokenizerTest(unittest.TestCase):
+    def test_matches_legacy_regex_at_every_small_chunk_size(self):
+        text = page()
+        expected = LEGACY_PATTERN.findall(text)
+        self.assertEqual(len(expected), 4)
+        for chunk_size in range(1, 8):
+            with self.subTest(chunk_size=chunk_size):
+                header, blocks = tokenize(text, chunk_size)
+                self.assertEqual(header, HEADER + '    ')
+                self.assertEqual(len(blocks), len(expected))
+                for (story, illustration), match in zip(blocks, expected):
+                    self.assertTrue(match.startswith(story))
+                    self.assertTrue(match.endswith(illustration))
+                    self.assertEqual(match[len(story):len(match) - len(illustration)].strip(), '')
+
+    def test_chunk_size_does_not_change_blocks(self):
+        text = page(6)
+        reference = tokenize(text, 64 * 1024)
+        for chunk_size in range(1, 8):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(tokenize(text, chunk_size), reference)
+
+    def test_nested_divs(self):
+        text = (HEADER
+                + '<div class="story"><div class="story-title">Deep</div><div><div>inner</div></div></div>\n'
+                '<DIV class="story-illustration"><div class="frame"><img src="a.jpg"></div></DIV>\n' + FOOTER)
+        for chunk_size in range(1, 8):
+            with self.subTest(chunk_size=chunk_size):
+                _, blocks = tokenize(text, chunk_size)
+                self.assertEqual(blocks, [(
+                    '<div class="story"><div class="story-title">Deep</div><div><div>inner</div></div></div>',
+                    '<DIV class="story-illustration"><div class="frame"><img src="a.jpg"></div></DIV>')])
+
+    def test_story_without_illustration(self):
+        first, second = STORY.format(n=1, i=0, payload='QUJD'), STORY.format(n=2, i=1, payload='REVG')
+        text = HEADER + first[:first.index('<div class="story-illustration"')] + '\n' + second + FOOTER
+        for chunk_size in (1, 3, 7):
+            with self.subTest(chunk_size=chunk_size):
+                _, blocks = tokenize(text, chunk_size)
+                self.assertEqual([story_title(story) for story, _ in blocks], ['Story 1', 'Story 2'])
+                self.assertEqual(blocks[0][1], '')
+                self.assertIn('REVG', blocks[1][1])
+
+    def test_fields(self):
+        _, blocks = tokenize(page(1), 5)
+        story = blocks[0][0]
+        self.assertEqual(story_title(story), 'Story 1')
+        self.assertEqual(story_theme(story), 'making new friends')
+        self.assertEqual(story_text(story),
+                         'Peep & Nugget met friend number 1.\n\nThey shared corn <3 and a "golden" egg.')
+
+
+if __name__ == '__main__':
+    unittest.main()